@@ -4,10 +4,11 @@
 """Interface used by provider and requirer of the 5G NRF."""
 
 import logging
-from typing import Optional
+from typing import NamedTuple, Optional
 
-from ops.charm import CharmBase, CharmEvents, RelationChangedEvent
-from ops.framework import EventBase, EventSource, Handle, Object
+from ops.charm import CharmBase, CharmEvents, RelationBrokenEvent, RelationChangedEvent
+from ops.framework import EventBase, EventSource, Handle, Object, StoredState
+from ops.model import Relation, RelationDataContent
 
 # The unique Charmhub library identifier, never change it
 LIBID = "491530841b444e289ba34d2e948e5669"
@@ -17,11 +18,44 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 3
+LIBPATCH = 5
 
 
 logger = logging.getLogger(__name__)
 
+NRF_ENDPOINT_KEYS = ("nrf_ipv4_address", "nrf_fqdn", "nrf_port", "nrf_api_version")
+
+
+class NRFEndpoint(NamedTuple):
+    """Immutable snapshot of the NRF endpoint published in relation data.
+
+    Being a named tuple, instances use `__slots__` and cannot be modified.
+    """
+
+    ipv4_address: str
+    fqdn: str
+    port: str
+    api_version: str
+
+    @classmethod
+    def from_relation_data(cls, relation_data: RelationDataContent) -> Optional["NRFEndpoint"]:
+        """Reads and validates the NRF endpoint from relation data in a single pass.
+
+        Args:
+            relation_data: Remote application relation data.
+
+        Returns:
+            NRFEndpoint: The NRF endpoint, or None if any of its keys is missing.
+        """
+        values = []
+        for key in NRF_ENDPOINT_KEYS:
+            value = relation_data.get(key)
+            if not value:
+                logger.info("No %s in relation data", key)
+                return None
+            values.append(value)
+        return cls(*values)
+
 
 class NRFAvailableEvent(EventBase):
     """Charm event emitted when an NRF is available."""
@@ -58,25 +92,73 @@ class NRFAvailableEvent(EventBase):
         self.nrf_api_version = snapshot["nrf_api_version"]
 
 
+class NRFChangedEvent(EventBase):
+    """Charm event emitted when a previously available NRF endpoint changes."""
+
+    def __init__(
+        self,
+        handle: Handle,
+        old_nrf_endpoint: dict,
+        new_nrf_endpoint: dict,
+    ):
+        """Init."""
+        super().__init__(handle)
+        self.old_nrf_endpoint = old_nrf_endpoint
+        self.new_nrf_endpoint = new_nrf_endpoint
+
+    @property
+    def old(self) -> NRFEndpoint:
+        """Returns the NRF endpoint before the change."""
+        return NRFEndpoint(**self.old_nrf_endpoint)
+
+    @property
+    def new(self) -> NRFEndpoint:
+        """Returns the NRF endpoint after the change."""
+        return NRFEndpoint(**self.new_nrf_endpoint)
+
+    def snapshot(self) -> dict:
+        """Returns snapshot."""
+        return {
+            "old_nrf_endpoint": self.old_nrf_endpoint,
+            "new_nrf_endpoint": self.new_nrf_endpoint,
+        }
+
+    def restore(self, snapshot: dict) -> None:
+        """Restores snapshot."""
+        self.old_nrf_endpoint = snapshot["old_nrf_endpoint"]
+        self.new_nrf_endpoint = snapshot["new_nrf_endpoint"]
+
+
 class FiveGNRFRequirerCharmEvents(CharmEvents):
     """List of events that the 5G NRF requirer charm can leverage."""
 
     nrf_available = EventSource(NRFAvailableEvent)
+    nrf_changed = EventSource(NRFChangedEvent)
 
 
 class FiveGNRFRequires(Object):
-    """Class to be instantiated by the charm requiring the 5G NRF Interface."""
+    """Class to be instantiated by the charm requiring the 5G NRF Interface.
+
+    `nrf_available` is emitted when the NRF endpoint becomes available and whenever it
+    changes, but not when the relation changes with the same NRF endpoint. When a previously
+    available endpoint changes, `nrf_changed` is emitted as well, with the old and new values.
+    """
 
     on = FiveGNRFRequirerCharmEvents()
+    _stored = StoredState()
 
     def __init__(self, charm: CharmBase, relationship_name: str):
         """Init."""
         super().__init__(charm, relationship_name)
         self.charm = charm
         self.relationship_name = relationship_name
+        self._stored.set_default(nrf_endpoint=None)
         self.framework.observe(
             charm.on[relationship_name].relation_changed, self._on_relation_changed
         )
+        self.framework.observe(
+            charm.on[relationship_name].relation_broken, self._on_relation_broken
+        )
 
     def _on_relation_changed(self, event: RelationChangedEvent) -> None:
         """Handler triggered on relation changed event.
@@ -91,27 +173,64 @@ class FiveGNRFRequires(Object):
         if not relation.app:
             logger.warning("No remote application in relation: %s", self.relationship_name)
             return
-        remote_app_relation_data = relation.data[relation.app]
-        if "nrf_ipv4_address" not in remote_app_relation_data:
-            logger.info(
-                "No nrf_ipv4_address in relation data - Not triggering nrf_available event"
-            )
-            return
-        if "nrf_fqdn" not in remote_app_relation_data:
-            logger.info("No nrf_fqdn in relation data - Not triggering nrf_available event")
+        nrf_endpoint = NRFEndpoint.from_relation_data(relation.data[relation.app])
+        if not nrf_endpoint:
+            logger.info("NRF information incomplete - Not triggering nrf_available event")
             return
-        if "nrf_port" not in remote_app_relation_data:
-            logger.info("No nrf_port in relation data - Not triggering nrf_available event")
-            return
-        if "nrf_api_version" not in remote_app_relation_data:
-            logger.info("No nrf_api_version in relation data - Not triggering nrf_available event")
+        old_nrf_endpoint = self._stored.nrf_endpoint
+        new_nrf_endpoint = nrf_endpoint._asdict()
+        if old_nrf_endpoint is not None and dict(old_nrf_endpoint) == new_nrf_endpoint:
+            logger.info("NRF information unchanged - Not triggering nrf_available event")
             return
+        self._stored.nrf_endpoint = new_nrf_endpoint
         self.on.nrf_available.emit(
-            nrf_ipv4_address=remote_app_relation_data["nrf_ipv4_address"],
-            nrf_fqdn=remote_app_relation_data["nrf_fqdn"],
-            nrf_port=remote_app_relation_data["nrf_port"],
-            nrf_api_version=remote_app_relation_data["nrf_api_version"],
+            nrf_ipv4_address=nrf_endpoint.ipv4_address,
+            nrf_fqdn=nrf_endpoint.fqdn,
+            nrf_port=nrf_endpoint.port,
+            nrf_api_version=nrf_endpoint.api_version,
+        )
+        if old_nrf_endpoint is not None:
+            self.on.nrf_changed.emit(
+                old_nrf_endpoint=dict(old_nrf_endpoint),
+                new_nrf_endpoint=new_nrf_endpoint,
+            )
+
+    def _on_relation_broken(self, event: RelationBrokenEvent) -> None:
+        """Handler triggered on relation broken event.
+
+        Forgets the last NRF endpoint so that `nrf_available` is emitted again on a new
+        relation.
+
+        Args:
+            event: Juju event (RelationBrokenEvent)
+
+        Returns:
+            None
+        """
+        self._stored.nrf_endpoint = None
+
+    def get_nrf_endpoint(self) -> Optional[NRFEndpoint]:
+        """Returns a snapshot of the NRF endpoint, reading relation data once.
+
+        Charms should take this snapshot once per hook and pass it around rather than
+        reading the individual properties below, which each look the relation up again.
+
+        Returns:
+            NRFEndpoint: The NRF endpoint, or None if it is not fully available.
+        """
+        remote_app_relation_data = self._remote_app_relation_data()
+        if remote_app_relation_data is None:
+            return None
+        return NRFEndpoint.from_relation_data(remote_app_relation_data)
+
+    def _remote_app_relation_data(self) -> Optional[RelationDataContent]:
+        """Returns the relation data of the remote application, if any."""
+        relation: Optional[Relation] = self.model.get_relation(
+            relation_name=self.relationship_name
         )
+        if not relation or not relation.app:
+            return None
+        return relation.data.get(relation.app)
 
     @property
     def nrf_ipv4_address_available(self) -> bool:
@@ -124,8 +243,7 @@ class FiveGNRFRequires(Object):
     @property
     def nrf_ipv4_address(self) -> Optional[str]:
         """Returns nrf_ipv4_address from relation data."""
-        relation = self.model.get_relation(relation_name=self.relationship_name)
-        remote_app_relation_data = relation.data.get(relation.app)
+        remote_app_relation_data = self._remote_app_relation_data()
         if not remote_app_relation_data:
             return None
         return remote_app_relation_data.get("nrf_ipv4_address", None)
@@ -141,8 +259,7 @@ class FiveGNRFRequires(Object):
     @property
     def nrf_fqdn(self) -> Optional[str]:
         """Returns nrf_fqdn from relation data."""
-        relation = self.model.get_relation(relation_name=self.relationship_name)
-        remote_app_relation_data = relation.data.get(relation.app)
+        remote_app_relation_data = self._remote_app_relation_data()
         if not remote_app_relation_data:
             return None
         return remote_app_relation_data.get("nrf_fqdn", None)
@@ -158,8 +275,7 @@ class FiveGNRFRequires(Object):
     @property
     def nrf_port(self) -> Optional[str]:
         """Returns nrf_port from relation data."""
-        relation = self.model.get_relation(relation_name=self.relationship_name)
-        remote_app_relation_data = relation.data.get(relation.app)
+        remote_app_relation_data = self._remote_app_relation_data()
         if not remote_app_relation_data:
             return None
         return remote_app_relation_data.get("nrf_port", None)
@@ -175,8 +291,7 @@ class FiveGNRFRequires(Object):
     @property
     def nrf_api_version(self) -> Optional[str]:
         """Returns nrf_api_version from relation data."""
-        relation = self.model.get_relation(relation_name=self.relationship_name)
-        remote_app_relation_data = relation.data.get(relation.app)
+        remote_app_relation_data = self._remote_app_relation_data()
         if not remote_app_relation_data:
             return None
         return remote_app_relation_data.get("nrf_api_version", None)
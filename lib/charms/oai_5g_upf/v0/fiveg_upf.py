@@ -3,11 +3,14 @@
 
 """Interface used by provider and requirer of the 5G UPF."""
 
+import ipaddress
+import json
 import logging
-from typing import Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-from ops.charm import CharmBase, CharmEvents, RelationChangedEvent
+from ops.charm import CharmBase, CharmEvents, RelationChangedEvent, RelationEvent
 from ops.framework import EventBase, EventSource, Handle, Object
+from ops.model import Relation, RelationDataContent
 
 # The unique Charmhub library identifier, never change it
 LIBID = "ed9606f2aaa64099937b7f57add2c42d"
@@ -17,12 +20,73 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 2
+LIBPATCH = 8
 
 
 logger = logging.getLogger(__name__)
 
 
+class UPFUnit(NamedTuple):
+    """Data plane endpoint and capacity of a UPF unit, published in its unit relation data."""
+
+    unit_name: str
+    upf_ipv4_address: str
+    n3_ipv4_address: str
+    upf_fqdn: str
+    cpu_cores: float
+    pool_sizes: Dict[str, int]
+    load: int
+    ue_ipv4_subnet: Optional[str] = None
+
+
+def _update_relation_data(
+    relation_data: RelationDataContent, values: Dict[str, Optional[str]]
+) -> None:
+    """Writes only the keys whose value changed, removing the keys set to None.
+
+    Every write triggers a relation-changed event on the remote side, so unchanged values
+    are not written again.
+
+    Args:
+        relation_data: Relation data bag
+        values: Values by key, None for keys to remove
+    """
+    for key, value in values.items():
+        if value is None:
+            if key in relation_data:
+                del relation_data[key]
+        elif relation_data.get(key) != value:
+            relation_data[key] = value
+
+
+class UPFSlice(NamedTuple):
+    """Network slice and data network served by a UPF."""
+
+    sst: int
+    sd: str
+    dnn: str
+
+
+class UPFRecord(NamedTuple):
+    """UPF application related to the requirer, read from its relation data."""
+
+    relation_id: int
+    app_name: str
+    upf_ipv4_address: str
+    upf_fqdn: str
+    ue_ipv4_subnet: Optional[str]
+    slices: Tuple[UPFSlice, ...]
+    units: Tuple[UPFUnit, ...]
+
+
+class RelatedUPFs(NamedTuple):
+    """UPF applications related to the requirer, indexed for lookups."""
+
+    by_relation_id: Dict[int, UPFRecord]
+    by_dnn: Dict[str, Tuple[UPFRecord, ...]]
+    by_slice: Dict[Tuple[int, str], Tuple[UPFRecord, ...]]
+
+
 class UPFAvailableEvent(EventBase):
     """Charm event emitted when an UPF is available."""
 
@@ -66,9 +130,20 @@ class FiveGUPFRequires(Object):
         super().__init__(charm, relationship_name)
         self.charm = charm
         self.relationship_name = relationship_name
+        self._related_upfs: Optional[RelatedUPFs] = None
         self.framework.observe(
             charm.on[relationship_name].relation_changed, self._on_relation_changed
         )
+        for event in (
+            charm.on[relationship_name].relation_joined,
+            charm.on[relationship_name].relation_departed,
+            charm.on[relationship_name].relation_broken,
+        ):
+            self.framework.observe(event, self._invalidate_related_upfs)
+
+    def _invalidate_related_upfs(self, _: RelationEvent) -> None:
+        """Drops the cached view of the related UPFs when relation data changes."""
+        self._related_upfs = None
 
     def _on_relation_changed(self, event: RelationChangedEvent) -> None:
         """Handler triggered on relation changed event.
@@ -79,6 +154,7 @@ class FiveGUPFRequires(Object):
         Returns:
             None
         """
+        self._invalidate_related_upfs(event)
         relation = event.relation
         if not relation.app:
             logger.warning("No remote application in relation: %s", self.relationship_name)
@@ -97,6 +173,93 @@ class FiveGUPFRequires(Object):
             upf_fqdn=remote_app_relation_data["upf_fqdn"],
         )
 
+    @property
+    def related_upfs(self) -> RelatedUPFs:
+        """Returns the related UPF applications, read in a single pass over the relations.
+
+        The view is cached for the rest of the hook and dropped when fiveg-upf relation data
+        changes. UPFs that have not published their address and FQDN yet are left out.
+        """
+        if self._related_upfs is None:
+            self._related_upfs = self._read_related_upfs()
+        return self._related_upfs
+
+    def _read_related_upfs(self) -> RelatedUPFs:
+        by_relation_id: Dict[int, UPFRecord] = {}
+        by_dnn: Dict[str, List[UPFRecord]] = {}
+        by_slice: Dict[Tuple[int, str], List[UPFRecord]] = {}
+        for relation in self.model.relations[self.relationship_name]:
+            upf_record = self._read_upf_record(relation)
+            if not upf_record:
+                continue
+            by_relation_id[relation.id] = upf_record
+            for upf_slice in upf_record.slices:
+                if upf_record not in by_dnn.setdefault(upf_slice.dnn, []):
+                    by_dnn[upf_slice.dnn].append(upf_record)
+                slice_key = (upf_slice.sst, upf_slice.sd)
+                if upf_record not in by_slice.setdefault(slice_key, []):
+                    by_slice[slice_key].append(upf_record)
+        return RelatedUPFs(
+            by_relation_id=by_relation_id,
+            by_dnn={dnn: tuple(records) for dnn, records in by_dnn.items()},
+            by_slice={key: tuple(records) for key, records in by_slice.items()},
+        )
+
+    @staticmethod
+    def _read_upf_record(relation: Relation) -> Optional[UPFRecord]:
+        if not relation.app:
+            return None
+        remote_app_relation_data = relation.data[relation.app]
+        if not {"upf_ipv4_address", "upf_fqdn"} <= set(remote_app_relation_data):
+            return None
+        try:
+            slices = tuple(
+                UPFSlice(sst=int(item["sst"]), sd=str(item["sd"]), dnn=item["dnn"])
+                for item in json.loads(remote_app_relation_data.get("slices", "[]"))
+            )
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Invalid slices in relation data of %s", relation.app.name)
+            slices = ()
+        units = []
+        for unit in sorted(relation.units, key=lambda unit: unit.name):
+            unit_relation_data = relation.data[unit]
+            try:
+                units.append(
+                    UPFUnit(
+                        unit_name=unit.name,
+                        upf_ipv4_address=unit_relation_data["upf_ipv4_address"],
+                        n3_ipv4_address=unit_relation_data["n3_ipv4_address"],
+                        upf_fqdn=unit_relation_data["upf_fqdn"],
+                        cpu_cores=float(unit_relation_data["cpu_cores"]),
+                        pool_sizes=json.loads(unit_relation_data["pool_sizes"]),
+                        load=int(unit_relation_data["load"]),
+                        ue_ipv4_subnet=unit_relation_data.get("ue_ipv4_subnet"),
+                    )
+                )
+            except (KeyError, ValueError):
+                logger.info("No valid endpoint in relation data of unit %s", unit.name)
+        return UPFRecord(
+            relation_id=relation.id,
+            app_name=relation.app.name,
+            upf_ipv4_address=remote_app_relation_data["upf_ipv4_address"],
+            upf_fqdn=remote_app_relation_data["upf_fqdn"],
+            ue_ipv4_subnet=remote_app_relation_data.get("ue_ipv4_subnet"),
+            slices=slices,
+            units=tuple(units),
+        )
+
+    @property
+    def _single_upf(self) -> Optional[UPFRecord]:
+        """Returns the related UPF, if there is exactly one."""
+        upf_records = list(self.related_upfs.by_relation_id.values())
+        if len(upf_records) > 1:
+            logger.warning(
+                "Several UPFs related through %s, use related_upfs instead",
+                self.relationship_name,
+            )
+            return None
+        return upf_records[0] if upf_records else None
+
     @property
     def upf_ipv4_address_available(self) -> bool:
         """Returns whether upf address is available in relation data."""
@@ -107,12 +270,9 @@ class FiveGUPFRequires(Object):
 
     @property
     def upf_ipv4_address(self) -> Optional[str]:
-        """Returns upf_ipv4_address from relation data."""
-        relation = self.model.get_relation(relation_name=self.relationship_name)
-        remote_app_relation_data = relation.data.get(relation.app)
-        if not remote_app_relation_data:
-            return None
-        return remote_app_relation_data.get("upf_ipv4_address", None)
+        """Returns upf_ipv4_address of the related UPF, None if there are several."""
+        upf_record = self._single_upf
+        return upf_record.upf_ipv4_address if upf_record else None
 
     @property
     def upf_fqdn_available(self) -> bool:
@@ -124,12 +284,74 @@ class FiveGUPFRequires(Object):
 
     @property
     def upf_fqdn(self) -> Optional[str]:
-        """Returns upf_fqdn from relation data."""
-        relation = self.model.get_relation(relation_name=self.relationship_name)
-        remote_app_relation_data = relation.data.get(relation.app)
-        if not remote_app_relation_data:
+        """Returns upf_fqdn of the related UPF, None if there are several."""
+        upf_record = self._single_upf
+        return upf_record.upf_fqdn if upf_record else None
+
+    @property
+    def ue_ipv4_subnet(self) -> Optional[str]:
+        """Returns the UE subnet routed to the related UPF, None if there are several.
+
+        Only UPFs that do not NAT UE traffic publish their UE subnet, so that the routers of
+        the data network can learn a route to it. The part of the subnet served by each unit
+        is published in its `UPFUnit`.
+        """
+        upf_record = self._single_upf
+        return upf_record.ue_ipv4_subnet if upf_record else None
+
+    @property
+    def upf_units(self) -> List[UPFUnit]:
+        """Returns the units of all related UPFs that published their endpoint."""
+        return [
+            upf_unit
+            for upf_record in self.related_upfs.by_relation_id.values()
+            for upf_unit in upf_record.units
+        ]
+
+    def set_smf_pfcp_address(self, pfcp_ipv4_address: str) -> None:
+        """Sets the PFCP (N4) address of this SMF unit in the data of all fiveg-upf relations.
+
+        UPFs associate with every SMF unit that published its address, so several SMF units
+        can share the PFCP load of a UPF.
+
+        Args:
+            pfcp_ipv4_address: PFCP address of the SMF unit
+
+        Returns:
+            None
+        """
+        for relation in self.model.relations[self.relationship_name]:
+            _update_relation_data(
+                relation.data[self.charm.unit], {"smf_pfcp_ipv4_address": pfcp_ipv4_address}
+            )
+
+    def least_loaded_upf(self, dnn: Optional[str] = None) -> Optional[UPFUnit]:
+        """Returns the UPF unit to place the next session on.
+
+        The load of a unit is relative to its own CPU capacity, so the least loaded unit is
+        the one with the most spare capacity in proportion; ties go to the unit with the
+        most CPU cores.
+
+        Args:
+            dnn: Only consider the UPFs serving this DNN.
+
+        Returns:
+            UPFUnit: Least loaded unit, None if no unit published its endpoint.
+        """
+        if dnn is None:
+            upf_units = self.upf_units
+        else:
+            upf_units = [
+                upf_unit
+                for upf_record in self.related_upfs.by_dnn.get(dnn, ())
+                for upf_unit in upf_record.units
+            ]
+        if not upf_units:
             return None
-        return remote_app_relation_data.get("upf_fqdn", None)
+        return min(
+            upf_units,
+            key=lambda upf_unit: (upf_unit.load, -upf_unit.cpu_cores, upf_unit.unit_name),
+        )
 
 
 class FiveGUPFProvides(Object):
@@ -141,18 +363,83 @@ class FiveGUPFProvides(Object):
         self.relationship_name = relationship_name
         self.charm = charm
 
+    @property
+    def smf_pfcp_addresses(self) -> List[str]:
+        """Returns the PFCP (N4) addresses published by the units of all related SMFs.
+
+        Returns:
+            list: Sorted IPv4 addresses, without duplicates.
+        """
+        addresses = set()
+        for relation in self.model.relations[self.relationship_name]:
+            for unit in relation.units:
+                address = relation.data[unit].get("smf_pfcp_ipv4_address")
+                if not address:
+                    continue
+                try:
+                    addresses.add(ipaddress.IPv4Address(address))
+                except ValueError:
+                    logger.warning("Invalid PFCP address in relation data of %s", unit.name)
+        return [str(address) for address in sorted(addresses)]
+
     def set_upf_information(
         self,
         upf_ipv4_address: str,
         upf_fqdn: str,
         relation_id: int,
+        ue_ipv4_subnet: Optional[str] = None,
+        slices: Optional[List[UPFSlice]] = None,
     ) -> None:
-        """Sets UPF information in relation data.
+        """Sets UPF information in relation data, writing only the values that changed.
 
         Args:
             upf_ipv4_address: UPF address
             upf_fqdn: UPF FQDN
             relation_id: Relation ID
+            ue_ipv4_subnet: UE subnet routed to the UPF, None if the UPF NATs UE traffic
+            slices: Network slices and data networks served by the UPF
+
+        Returns:
+            None
+        """
+        relation = self.model.get_relation(self.relationship_name, relation_id=relation_id)
+        if not relation:
+            raise RuntimeError(f"Relation {self.relationship_name} not created yet.")
+        _update_relation_data(
+            relation.data[self.charm.app],
+            {
+                "upf_ipv4_address": upf_ipv4_address,
+                "upf_fqdn": upf_fqdn,
+                "ue_ipv4_subnet": ue_ipv4_subnet or None,
+                "slices": (
+                    json.dumps([upf_slice._asdict() for upf_slice in slices]) if slices else None
+                ),
+            },
+        )
+
+    def set_upf_unit_information(
+        self,
+        relation_id: int,
+        upf_ipv4_address: str,
+        n3_ipv4_address: str,
+        upf_fqdn: str,
+        cpu_cores: float,
+        pool_sizes: Dict[str, int],
+        load: int,
+        ue_ipv4_subnet: Optional[str] = None,
+    ) -> None:
+        """Sets the endpoint and capacity of this UPF unit in unit relation data, if changed.
+
+        Args:
+            relation_id: Relation ID
+            upf_ipv4_address: Pod address of the unit
+            n3_ipv4_address: Address of the unit on the access (N3) network
+            upf_fqdn: FQDN of the unit
+            cpu_cores: Number of CPUs the unit may use
+            pool_sizes: Number of data plane threads by interface
+            load: CPU load of the unit, in percent of its capacity
+            ue_ipv4_subnet: Part of the UE subnet routed to the unit, None if the UPF NATs UE
+                traffic
 
         Returns:
             None
@@ -160,9 +447,15 @@ class FiveGUPFProvides(Object):
         relation = self.model.get_relation(self.relationship_name, relation_id=relation_id)
         if not relation:
             raise RuntimeError(f"Relation {self.relationship_name} not created yet.")
-        relation.data[self.charm.app].update(
+        _update_relation_data(
+            relation.data[self.charm.unit],
             {
                 "upf_ipv4_address": upf_ipv4_address,
+                "n3_ipv4_address": n3_ipv4_address,
                 "upf_fqdn": upf_fqdn,
-            }
+                "cpu_cores": str(cpu_cores),
+                "pool_sizes": json.dumps(pool_sizes, sort_keys=True),
+                "load": str(load),
+                "ue_ipv4_subnet": ue_ipv4_subnet or None,
+            },
         )
@@ -89,6 +89,47 @@ class SomeCharm(CharmBase):
     # ...
 ```
 
+To avoid importing `lightkube` in hooks that never patch the service, the ports can also be
+given as a callable. It is only called when the service is patched:
+
+```python
+# ...
+from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    self.service_patcher = KubernetesServicePatch(self, self._service_ports)
+    # ...
+
+  def _service_ports(self):
+    from lightkube.models.core_v1 import ServicePort
+
+    return [ServicePort(443, name=f"{self.app.name}")]
+```
+
+For `LoadBalancer`/`NodePort` services, the external traffic policy and the session affinity
+can also be set, for example to keep the source address of external clients:
+
+```python
+# ...
+from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
+from lightkube.models.core_v1 import ServicePort
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    port = ServicePort(443, name=f"{self.app.name}", targetPort=443)
+    self.service_patcher = KubernetesServicePatch(
+        self,
+        [port],
+        "LoadBalancer",
+        external_traffic_policy="Local",
+        session_affinity="ClientIP",
+    )
+    # ...
+```
+
 Bound with custom events by providing `refresh_event` argument:
 For example, you would like to have a configurable port in your charm and want to apply
 service patch every time charm config is changed.
@@ -125,17 +166,16 @@ def setUp(self, *unused):
 
 import logging
 from types import MethodType
-from typing import List, Literal, Optional, Union
-
-from lightkube import ApiError, Client
-from lightkube.core import exceptions
-from lightkube.models.core_v1 import ServicePort, ServiceSpec
-from lightkube.models.meta_v1 import ObjectMeta
-from lightkube.resources.core_v1 import Service
-from lightkube.types import PatchType
+from typing import TYPE_CHECKING, Callable, List, Literal, Optional, Union
+
 from ops.charm import CharmBase
 from ops.framework import BoundEvent, Object
 
+if TYPE_CHECKING:
+    from lightkube import Client
+    from lightkube.models.core_v1 import ServicePort
+    from lightkube.resources.core_v1 import Service
+
 logger = logging.getLogger(__name__)
 
 # The unique Charmhub library identifier, never change it
@@ -146,9 +186,18 @@ LIBAPI = 1
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 5
+LIBPATCH = 9
+
+ServiceType = Literal["ClusterIP", "NodePort", "LoadBalancer"]
+
 
-ServiceType = Literal["ClusterIP", "LoadBalancer"]
+def __getattr__(name: str):
+    """Lazily exposes `ServicePort` so that importing this library does not import lightkube."""
+    if name == "ServicePort":
+        from lightkube.models.core_v1 import ServicePort
+
+        return ServicePort
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class KubernetesServicePatch(Object):
@@ -157,7 +206,7 @@ class KubernetesServicePatch(Object):
     def __init__(
         self,
         charm: CharmBase,
-        ports: List[ServicePort],
+        ports: Union[List["ServicePort"], Callable[[], List["ServicePort"]]],
         service_name: Optional[str] = None,
         service_type: ServiceType = "ClusterIP",
         additional_labels: Optional[dict] = None,
@@ -165,12 +214,17 @@ class KubernetesServicePatch(Object):
         additional_annotations: Optional[dict] = None,
         *,
         refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+        client_factory: Optional[Callable[[], "Client"]] = None,
+        external_traffic_policy: Optional[str] = None,
+        session_affinity: Optional[str] = None,
     ):
         """Constructor for KubernetesServicePatch.
 
         Args:
             charm: the charm that is instantiating the library.
-            ports: a list of ServicePorts
+            ports: a list of ServicePorts, or a callable returning it. A callable is only
+                invoked when the service is patched, which lets the charm avoid importing
+                lightkube in hooks that do not patch the service.
             service_name: allows setting custom name to the patched service. If none given,
                 application name will be used.
             service_type: desired type of K8s service. Default value is in line with ServiceSpec's
@@ -183,18 +237,26 @@ class KubernetesServicePatch(Object):
             refresh_event: an optional bound event or list of bound events which
                 will be observed to re-apply the patch (e.g. on port change).
                 The `install` and `upgrade-charm` events would be observed regardless.
+            client_factory: an optional callable returning the lightkube client to use, so
+                that the charm can share one client (and its connection pool) with its own
+                Kubernetes calls. A new client is created on each patch if none given.
+            external_traffic_policy: `Cluster` or `Local`, only for `NodePort` and
+                `LoadBalancer` services. `Local` keeps the client source address and avoids
+                a second hop through another node. Left to the K8s default if none given.
+            session_affinity: `None` or `ClientIP`. Left to the K8s default if none given.
         """
         super().__init__(charm, "kubernetes-service-patch")
         self.charm = charm
         self.service_name = service_name if service_name else self._app
-        self.service = self._service_object(
-            ports,
-            service_name,
-            service_type,
-            additional_labels,
-            additional_selectors,
-            additional_annotations,
-        )
+        self._ports = ports
+        self._service_type = service_type
+        self._additional_labels = additional_labels
+        self._additional_selectors = additional_selectors
+        self._additional_annotations = additional_annotations
+        self._external_traffic_policy = external_traffic_policy
+        self._session_affinity = session_affinity
+        self._service: Optional["Service"] = None
+        self._client_factory = client_factory
 
         # Make mypy type checking happy that self._patch is a method
         assert isinstance(self._patch, MethodType)
@@ -210,15 +272,38 @@ class KubernetesServicePatch(Object):
             for evt in refresh_event:
                 self.framework.observe(evt, self._patch)
 
+    @property
+    def service(self) -> "Service":
+        """The desired Service, built on first use.
+
+        Returns:
+            Service: A valid representation of a Kubernetes Service with the correct ports.
+        """
+        if self._service is None:
+            ports = self._ports() if callable(self._ports) else self._ports
+            self._service = self._service_object(
+                ports,
+                self.service_name,
+                self._service_type,
+                self._additional_labels,
+                self._additional_selectors,
+                self._additional_annotations,
+                self._external_traffic_policy,
+                self._session_affinity,
+            )
+        return self._service
+
     def _service_object(
         self,
-        ports: List[ServicePort],
+        ports: List["ServicePort"],
         service_name: Optional[str] = None,
         service_type: ServiceType = "ClusterIP",
         additional_labels: Optional[dict] = None,
         additional_selectors: Optional[dict] = None,
         additional_annotations: Optional[dict] = None,
-    ) -> Service:
+        external_traffic_policy: Optional[str] = None,
+        session_affinity: Optional[str] = None,
+    ) -> "Service":
         """Creates a valid Service representation.
 
         Args:
@@ -232,10 +317,17 @@ class KubernetesServicePatch(Object):
             additional_selectors: Selectors to be added to the kubernetes service (by default only
                 "app.kubernetes.io/name" is set to the service name)
             additional_annotations: Annotations to be added to the kubernetes service.
+            external_traffic_policy: `Cluster` or `Local`, for `NodePort` and `LoadBalancer`
+                services.
+            session_affinity: `None` or `ClientIP`.
 
         Returns:
             Service: A valid representation of a Kubernetes Service with the correct ports.
         """
+        from lightkube.models.core_v1 import ServiceSpec
+        from lightkube.models.meta_v1 import ObjectMeta
+        from lightkube.resources.core_v1 import Service
+
         if not service_name:
             service_name = self._app
         labels = {"app.kubernetes.io/name": self._app}
@@ -257,17 +349,31 @@ class KubernetesServicePatch(Object):
                 selector=selector,
                 ports=ports,
                 type=service_type,
+                externalTrafficPolicy=external_traffic_policy,
+                sessionAffinity=session_affinity,
             ),
         )
 
     def _patch(self, _) -> None:
+        """Patches the service on the install, upgrade-charm and refresh events."""
+        self.patch()
+
+    def patch(self) -> None:
         """Patch the Kubernetes service created by Juju to map the correct port.
 
+        Charms call it directly to patch the service at a point of their own choosing, such
+        as once their config is validated.
+
         Raises:
             PatchFailed: if patching fails due to lack of permissions, or otherwise.
         """
+        from lightkube import ApiError
+        from lightkube.core import exceptions
+        from lightkube.resources.core_v1 import Service
+        from lightkube.types import PatchType
+
         try:
-            client = Client()
+            client = self._client()
         except exceptions.ConfigError as e:
             logger.warning("Error creating k8s client: %s", e)
             return
@@ -286,7 +392,9 @@ class KubernetesServicePatch(Object):
         else:
             logger.info("Kubernetes service '%s' patched successfully", self._app)
 
-    def _delete_and_create_service(self, client: Client):
+    def _delete_and_create_service(self, client: "Client"):
+        from lightkube.resources.core_v1 import Service
+
         service = client.get(Service, self._app, namespace=self._namespace)
         service.metadata.name = self.service_name  # type: ignore[attr-defined]
         service.metadata.resourceVersion = service.metadata.uid = None  # type: ignore[attr-defined]   # noqa: E501
@@ -299,10 +407,21 @@ class KubernetesServicePatch(Object):
         Returns:
             bool: A boolean indicating if the service patch has been applied.
         """
-        client = Client()
+        client = self._client()
         return self._is_patched(client)
 
-    def _is_patched(self, client: Client) -> bool:
+    def _client(self) -> "Client":
+        """Returns the lightkube client from the factory, or a new one."""
+        if self._client_factory:
+            return self._client_factory()
+        from lightkube import Client
+
+        return Client()
+
+    def _is_patched(self, client: "Client") -> bool:
+        from lightkube import ApiError
+        from lightkube.resources.core_v1 import Service
+
         # Get the relevant service from the cluster
         try:
             service = client.get(Service, name=self.service_name, namespace=self._namespace)
@@ -319,7 +438,14 @@ class KubernetesServicePatch(Object):
         fetched_ports = [
             (p.port, p.targetPort) for p in service.spec.ports  # type: ignore[attr-defined]
         ]  # noqa: E501
-        return expected_ports == fetched_ports
+        if expected_ports != fetched_ports:
+            return False
+        # Fields left to the K8s default are not compared
+        for field in ("type", "externalTrafficPolicy", "sessionAffinity"):
+            expected_value = getattr(self.service.spec, field)
+            if expected_value is not None and getattr(service.spec, field) != expected_value:
+                return False
+        return True
 
     @property
     def _app(self) -> str:
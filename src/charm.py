@@ -5,79 +5,393 @@
 """Charmed Operator for the OpenAirInterface 5G Core UPF component."""
 
 
+import functools
 import logging
+import re
+import time
+from enum import Enum
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 
-from charms.oai_5g_nrf.v0.fiveg_nrf import FiveGNRFRequires  # type: ignore[import]
-from charms.oai_5g_upf.v0.fiveg_upf import FiveGUPFProvides  # type: ignore[import]
+from charms.oai_5g_nrf.v0.fiveg_nrf import (  # type: ignore[import]
+    FiveGNRFRequires,
+    NRFEndpoint,
+)
+from charms.oai_5g_upf.v0.fiveg_upf import (  # type: ignore[import]
+    FiveGUPFProvides,
+    UPFSlice,
+)
 from charms.observability_libs.v1.kubernetes_service_patch import (  # type: ignore[import]
     KubernetesServicePatch,
-    ServicePort,
 )
-from jinja2 import Environment, FileSystemLoader
-from ops.charm import CharmBase, ConfigChangedEvent, InstallEvent
+from ops.charm import (
+    ActionEvent,
+    CharmBase,
+    ConfigChangedEvent,
+    InstallEvent,
+    UpgradeCharmEvent,
+)
+from ops.framework import EventBase, StoredState
 from ops.main import main
 from ops.model import ActiveStatus, BlockedStatus, ModelError, WaitingStatus
+from ops.pebble import APIError, ChangeError, ExecError, Layer
+
+from cpu_layout import (
+    AUTO_SIZED_POOL_THREADS,
+    INTERFACE_THREADS,
+    ITTI_S1U,
+    POOL_SIZE_AUTO,
+    S1U,
+    SGI,
+    CpuLayout,
+    auto_pool_size,
+    cpu_limit_from_cpu_max,
+    cpu_load,
+    cpu_mask,
+    cpu_usage_from_cpu_stat,
+    cpus_allowed_from_proc_status,
+    parse_cpu_layout,
+)
+from multus import (
+    NETWORK_ATTACHMENT_PLUGINS,
+    NETWORKS_ANNOTATION,
+    NetworkAttachment,
+    networks_annotation,
+    validate_ip_interface,
+)
+from network_tuning import (
+    MANAGED_NOTRACK_UDP_PORTS,
+    NETWORK_TUNING_PROFILES,
+    NetworkTuningProfile,
+    network_affinity_command,
+    notrack_rules,
+    packet_steering_command,
+    parse_sysctl_output,
+)
+from slices import Slice, parse_slices
+from ue_pool import ue_sub_pool, unit_ordinal
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+    from lightkube import Client
+    from lightkube.models.core_v1 import ServicePort
+    from ops.pebble import LayerDict, ServiceDict
 
-from kubernetes import Kubernetes
+    from kubernetes import Kubernetes
 
 logger = logging.getLogger(__name__)
 
 BASE_CONFIG_PATH = "/openair-spgwu-tiny/etc"
 CONFIG_FILE_NAME = "spgw_u.conf"
+TEMPLATES_DIRECTORY = "src/templates"
+TEMPLATES_BYTECODE_CACHE_DIRECTORY = ".jinja2_cache"
+MEMORY_QUANTITY_PATTERN = re.compile(r"^[1-9][0-9]*(Ki|Mi|Gi|Ti|k|M|G|T)?$")
+HUGEPAGES_PAGE_SIZES = ("2Mi", "1Gi")
+HUGEPAGES_MOUNT_PATH = "/dev/hugepages"
+# Dedicated networks, by config option prefix, and the name of their interface in the pod
+ACCESS_NETWORK = "access"
+ACCESS_INTERFACE = "n3"
+CORE_NETWORK = "core"
+CORE_INTERFACE = "n6"
+MIN_MTU = 576
+MAX_MTU = 9216
+DEFAULT_MTU = 1500
+# Outer IPv4 (20), UDP (8) and GTP-U (8) headers, plus the PDU session container extension
+# header (8) that N3 packets carry in 5G
+GTPU_OVERHEAD = 44
+SERVICE_TYPES = ("ClusterIP", "NodePort", "LoadBalancer")
+EXTERNAL_TRAFFIC_POLICIES = ("Cluster", "Local")
+SESSION_AFFINITIES = ("None", "ClientIP")
+# UDP ports bound on the node in host network mode, the same as the service ports
+PEER_RELATION_NAME = "upf-peers"
+HOST_NETWORK_PORTS = {"pfcp": 8805, "gtpu": 2152}
+# Granularity of the load published to SMFs, so that small variations between two
+# update-status hooks do not rewrite the relation data
+LOAD_STEP_PERCENT = 10
+# Prints the CPU quota and period of the workload cgroup, from cpu.max on cgroup v2 or from
+# cpu.cfs_quota_us and cpu.cfs_period_us on cgroup v1.
+CGROUP_CPU_MAX_COMMAND = [
+    "sh",
+    "-c",
+    "cat /sys/fs/cgroup/cpu.max 2>/dev/null || "
+    "echo $(cat /sys/fs/cgroup/cpu/cpu.cfs_quota_us /sys/fs/cgroup/cpu/cpu.cfs_period_us)",
+]
+CGROUP_CPU_STAT_COMMAND = [
+    "sh",
+    "-c",
+    "cat /sys/fs/cgroup/cpu.stat 2>/dev/null || "
+    "echo usage_usec $(($(cat /sys/fs/cgroup/cpuacct/cpuacct.usage) / 1000))",
+]
+
+
+class ConfigChangeAction(Enum):
+    """Action taken on the workload to apply a configuration change, cheapest first."""
+
+    NONE = "none"
+    REPLAN = "replan"
+    RESTART = "restart"
+
+
+UPLINK_FAST_PATH_STATUS_MESSAGE = "uplink fast path: UL PFCP rules (QoS, gating) not enforced"
+
+CONFIG_CHANGE_STATUS_MESSAGES = {
+    ConfigChangeAction.NONE: "Config updated without restart",
+    ConfigChangeAction.REPLAN: "Config updated, service replanned",
+    ConfigChangeAction.RESTART: "Config updated, service restarted",
+}
 
 
 class Oai5GUPFOperatorCharm(CharmBase):
     """Charm the service."""
 
+    _stored = StoredState()
+
     def __init__(self, *args):
         """Observes juju events."""
         super().__init__(*args)
+        self._stored.set_default(
+            config_file_context={}, cpu_usage_sample={}, original_sysctls={}, ue_route=[]
+        )
         self._container_name = self._service_name = "upf"
         self._container = self.unit.get_container(self._container_name)
-        self.kubernetes = Kubernetes(namespace=self.model.name)
-        self.service_patcher = KubernetesServicePatch(
-            charm=self,
-            ports=[
-                ServicePort(
-                    name="oai-spgwu-tiny",
-                    port=8805,
-                    protocol="UDP",
-                    targetPort=8805,
-                ),
-                ServicePort(
-                    name="s1u",
-                    port=2152,
-                    protocol="UDP",
-                    targetPort=2152,
-                ),
-            ],
-        )
+        self._kubernetes: Optional["Kubernetes"] = None
+        # The patcher also patches the service on install and upgrade-charm: it is not created
+        # for an invalid service config, which would turn the service back to its defaults.
+        # On config-changed, the service is patched once the whole config is validated.
+        self.service_patcher: Optional[KubernetesServicePatch] = None
+        service_settings = self._service_settings()
+        if service_settings is not None:
+            self.service_patcher = KubernetesServicePatch(
+                charm=self,
+                ports=self._service_ports,
+                client_factory=self._kubernetes_client,
+                **service_settings,
+            )
         self.upf_provides = FiveGUPFProvides(self, "fiveg-upf")
         self.nrf_requires = FiveGNRFRequires(self, "fiveg-nrf")
         self.framework.observe(
             self.on.fiveg_upf_relation_joined, self._on_fiveg_upf_relation_joined
         )
+        self.framework.observe(self.on.fiveg_upf_relation_changed, self._on_config_changed)
+        self.framework.observe(self.on.fiveg_upf_relation_departed, self._on_config_changed)
         self.framework.observe(self.on.install, self._on_install)
+        self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
         self.framework.observe(self.on.config_changed, self._on_config_changed)
-        self.framework.observe(self.on.fiveg_nrf_relation_changed, self._on_config_changed)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(
+            self.on.show_network_affinity_action, self._on_show_network_affinity_action
+        )
+        self.framework.observe(self.nrf_requires.on.nrf_available, self._on_config_changed)
+        self.framework.observe(self.on.upf_peers_relation_joined, self._on_config_changed)
+        self.framework.observe(self.on.upf_peers_relation_departed, self._on_config_changed)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+
+    @property
+    def kubernetes(self) -> "Kubernetes":
+        """Returns the Kubernetes helper, importing lightkube only on first use."""
+        if self._kubernetes is None:
+            from kubernetes import Kubernetes
 
-    def _on_fiveg_upf_relation_joined(self, event) -> None:
+            self._kubernetes = Kubernetes(namespace=self.model.name)
+        return self._kubernetes
+
+    def _kubernetes_client(self) -> "Client":
+        """Returns the K8s client shared with the Kubernetes helper."""
+        return self.kubernetes.client
+
+    def _on_commit(self, _) -> None:
+        """Triggered at the end of every hook."""
+        if self._kubernetes is not None:
+            self._kubernetes.log_api_usage()
+
+    def _service_settings(self) -> Optional[dict]:
+        """Returns the settings of the Kubernetes service, None if they are invalid."""
+        try:
+            self._validate_service_config()
+        except ValueError:
+            return None
+        return dict(
+            service_type=self._config_service_type,
+            external_traffic_policy=self._config_external_traffic_policy or None,
+            session_affinity=self._config_session_affinity or None,
+        )
+
+    def _validate_service_config(self) -> None:
+        """Checks the config options of the Kubernetes service.
+
+        Raises:
+            ValueError: If an option is invalid.
+        """
+        if self._config_service_type not in SERVICE_TYPES:
+            raise ValueError(f"service-type must be one of {', '.join(SERVICE_TYPES)}")
+        if self._config_external_traffic_policy:
+            if self._config_external_traffic_policy not in EXTERNAL_TRAFFIC_POLICIES:
+                raise ValueError(
+                    "external-traffic-policy must be one of "
+                    f"{', '.join(EXTERNAL_TRAFFIC_POLICIES)}"
+                )
+            if self._config_service_type == "ClusterIP":
+                raise ValueError(
+                    "external-traffic-policy requires a NodePort or LoadBalancer service-type"
+                )
+        if self._config_session_affinity not in ("",) + SESSION_AFFINITIES:
+            raise ValueError(f"session-affinity must be one of {', '.join(SESSION_AFFINITIES)}")
+
+    @staticmethod
+    def _service_ports() -> List["ServicePort"]:
+        """Returns the ports exposed by the Kubernetes service."""
+        from lightkube.models.core_v1 import ServicePort
+
+        return [
+            ServicePort(
+                name="oai-spgwu-tiny",
+                port=8805,
+                protocol="UDP",
+                targetPort=8805,
+            ),
+            ServicePort(
+                name="s1u",
+                port=2152,
+                protocol="UDP",
+                targetPort=2152,
+            ),
+        ]
+
+    def _on_fiveg_upf_relation_joined(self, _) -> None:
         """Triggered when a relation is joined.
 
-        Args:
-            event: Relation Joined Event
+        Relations joined before the UPF service runs are set up by the next reconciliation
+        of the fiveg-upf relations, once the service is started.
         """
-        if not self.unit.is_leader():
-            return
+        self._reconcile_fiveg_upf_relations()
+
+    def _reconcile_fiveg_upf_relations(self) -> None:
+        """Brings the data of every fiveg-upf relation up to date with the running UPF."""
         if not self._upf_service_started:
-            logger.info("UPF service not started yet, deferring event")
-            event.defer()
+            logger.info("UPF service not started yet, not publishing UPF information")
             return
-        self.upf_provides.set_upf_information(
+        self._update_upf_relations()
+        self._publish_unit_information()
+
+    def _published_slices(self) -> Optional[List[UPFSlice]]:
+        """Returns the slices announced to the SMFs, None if the slices config is invalid."""
+        try:
+            slices = self._config_slices
+        except ValueError:
+            return None
+        return [UPFSlice(sst=slice.sst, sd=slice.sd, dnn=slice.dnn) for slice in slices]
+
+    def _update_upf_relations(self) -> None:
+        """Updates the UPF information in the data of all the fiveg-upf relations."""
+        if not self.unit.is_leader():
+            return
+        upf_information = dict(
             upf_ipv4_address="127.0.0.1",
             upf_fqdn=f"{self.model.app.name}.{self.model.name}.svc.cluster.local",
-            relation_id=event.relation.id,
+            ue_ipv4_subnet=None if self._config_snat else self._config_network_ue_ip,
+            slices=self._published_slices(),
+        )
+        for relation in self.model.relations["fiveg-upf"]:
+            self.upf_provides.set_upf_information(relation_id=relation.id, **upf_information)
+
+    def _publish_unit_information(self) -> None:
+        """Sets the endpoint and capacity of the unit in the data of all fiveg-upf relations.
+
+        Every unit publishes its own pod and N3 addresses, so that SMFs can spread sessions
+        across units instead of sending them all to the Kubernetes service. Without SNAT, it
+        also publishes the part of the UE pool routed to it.
+        """
+        relations = self.model.relations["fiveg-upf"]
+        if not relations:
+            return
+        pod_ip = self._unit_pod_ip
+        if not pod_ip:
+            logger.info("Pod address not known yet, not publishing the unit endpoint")
+            return
+        try:
+            cpu_cores = self._unit_cpu_capacity
+            load = self._unit_load(cpu_cores)
+            pool_sizes = self._validated_pool_sizes()
+            ue_pool = None if self._config_snat else self._unit_ue_pool
+        except ValueError as e:
+            logger.warning("Not publishing the unit endpoint: %s", e)
+            return
+        for relation in relations:
+            self.upf_provides.set_upf_unit_information(
+                relation_id=relation.id,
+                upf_ipv4_address=pod_ip,
+                n3_ipv4_address=self._unit_n3_ip or pod_ip,
+                upf_fqdn=self._unit_fqdn,
+                cpu_cores=cpu_cores,
+                pool_sizes=pool_sizes,
+                load=load,
+                ue_ipv4_subnet=ue_pool,
+            )
+
+    @property
+    def _unit_pod_ip(self) -> Optional[str]:
+        binding = self.model.get_binding("fiveg-upf")
+        if not binding or not binding.network.bind_address:
+            return None
+        return str(binding.network.bind_address)
+
+    @property
+    def _unit_n3_ip(self) -> Optional[str]:
+        """Returns the address of the unit on a dedicated access network, if any."""
+        access_ip = str(self.model.config.get(f"{ACCESS_NETWORK}-ip", "")).strip()
+        if self._config_host_network or not access_ip:
+            return None
+        return access_ip.split("/")[0]
+
+    @property
+    def _unit_fqdn(self) -> str:
+        """Returns the FQDN of the unit pod in the headless service created by Juju."""
+        return (
+            f"{self.app.name}-{unit_ordinal(self.unit.name)}.{self.app.name}-endpoints."
+            f"{self.model.name}.svc.cluster.local"
+        )
+
+    @property
+    def _unit_cpu_capacity(self) -> float:
+        """Returns the number of CPUs the workload may use.
+
+        Raises:
+            ValueError: If the CPUs could not be read from the workload container.
+        """
+        return self._workload_cpu_limit or float(len(self._workload_cpus))
+
+    def _unit_load(self, cpu_capacity: float) -> int:
+        """Returns the CPU load of the workload since the previous reading.
+
+        oai_spgwu does not expose its number of sessions, so the CPU time used by the
+        workload cgroup between two hooks is used as load instead: packet processing is
+        what keeps the UPF CPUs busy.
+
+        Args:
+            cpu_capacity: Number of CPUs the workload may use.
+
+        Returns:
+            int: Load in percent of the CPU capacity, rounded down to a multiple of
+                `LOAD_STEP_PERCENT`, 0 on the first reading.
+
+        Raises:
+            ValueError: If the CPU usage could not be read from the workload container.
+        """
+        try:
+            process = self._container.exec(CGROUP_CPU_STAT_COMMAND)
+            cpu_stat, _ = process.wait_output()
+        except (ExecError, APIError, ChangeError) as e:
+            raise ValueError(f"could not read CPU usage of workload container: {e}")
+        cpu_usage = cpu_usage_from_cpu_stat(cpu_stat)
+        now = time.time()
+        previous_sample = dict(self._stored.cpu_usage_sample)
+        self._stored.cpu_usage_sample = {"cpu_usage": cpu_usage, "time": now}
+        if not previous_sample:
+            return 0
+        load = cpu_load(
+            cpu_usage - previous_sample["cpu_usage"], now - previous_sample["time"], cpu_capacity
         )
+        return load // LOAD_STEP_PERCENT * LOAD_STEP_PERCENT
 
     @property
     def _upf_service_started(self) -> bool:
@@ -100,22 +414,41 @@ class Oai5GUPFOperatorCharm(CharmBase):
         Returns:
             None
         """
-        if not self.kubernetes.statefulset_is_patched(
-            statefulset_name=self.app.name,
-        ):
-            self.kubernetes.patch_statefulset(
-                statefulset_name=self.app.name,
-            )
+        if not self.unit.is_leader():
+            return
+        try:
+            resources, network_attachments = self._validated_statefulset_config()
+        except ValueError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return
+        self._patch_statefulset(resources, network_attachments)
 
-    def _on_config_changed(self, event: ConfigChangedEvent) -> None:
-        """Triggered on any change in configuration.
+    def _on_upgrade_charm(self, _: UpgradeCharmEvent) -> None:
+        """Patches the statefulset again if the new charm expects different settings."""
+        try:
+            resources, network_attachments = self._validated_statefulset_config()
+        except ValueError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return
+        self._reconcile_statefulset(resources, network_attachments)
+
+    def _on_config_changed(self, event: EventBase) -> None:
+        """Triggered on any change in configuration or in the NRF endpoint.
 
         Args:
-            event: Config Changed Event
+            event: Config Changed Event or NRF Available Event
 
         Returns:
             None
         """
+        try:
+            resources, network_attachments = self._validated_statefulset_config()
+        except ValueError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return
+        if isinstance(event, ConfigChangedEvent):
+            # Kubernetes resources only depend on the config, relation hooks do not check them
+            self._reconcile_kubernetes_resources(resources, network_attachments)
         if not self._container.can_connect():
             self.unit.status = WaitingStatus("Waiting for Pebble in workload container")
             event.defer()
@@ -123,25 +456,760 @@ class Oai5GUPFOperatorCharm(CharmBase):
         if not self._nrf_relation_created:
             self.unit.status = BlockedStatus("Waiting for relation to NRF to be created")
             return
-        if not self.nrf_requires.nrf_ipv4_address_available:
+        nrf_endpoint = self.nrf_requires.get_nrf_endpoint()
+        if not nrf_endpoint:
             self.unit.status = WaitingStatus(
-                "Waiting for NRF IPv4 address to be available in relation data"
+                "Waiting for NRF information to be available in relation data"
+            )
+            return
+        try:
+            cpu_layout, pool_sizes, tuning_profile = self._validated_workload_config()
+        except ValueError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return
+
+        config_file_context = self._config_file_context(nrf_endpoint, cpu_layout, pool_sizes)
+        config_file_changed, changed_fields = self._update_config_file(config_file_context)
+        action = self._config_change_action(changed_fields)
+        tuning_mismatches = self._apply_network_tuning(tuning_profile)
+        tuning_mismatches += self._apply_packet_steering(cpu_layout)
+        tuning_mismatches += self._apply_mtus()
+        tuning_mismatches += self._apply_ue_routes()
+        self._apply_config_change(action)
+        if tuning_mismatches:
+            self.unit.status = BlockedStatus(
+                f"Network tuning not applied: {', '.join(tuning_mismatches)}"
+            )
+        else:
+            self.unit.status = self._active_status(config_file_changed, action)
+        self._publish_unit_ue_pool()
+        self._reconcile_fiveg_upf_relations()
+
+    def _on_update_status(self, _) -> None:
+        """Refreshes the UPF information and the unit load published to the SMFs."""
+        self._reconcile_fiveg_upf_relations()
+
+    def _active_status(
+        self, config_file_changed: bool, action: ConfigChangeAction
+    ) -> ActiveStatus:
+        """Returns the status of a running UPF, reporting the last change and the fast path.
+
+        Args:
+            config_file_changed: Whether the config file was pushed.
+            action: Action taken on the workload.
+
+        Returns:
+            ActiveStatus: Unit status.
+        """
+        messages = []
+        if config_file_changed or action != ConfigChangeAction.NONE:
+            messages.append(CONFIG_CHANGE_STATUS_MESSAGES[action])
+        if self._config_uplink_fast_path:
+            messages.append(UPLINK_FAST_PATH_STATUS_MESSAGE)
+        return ActiveStatus(", ".join(messages))
+
+    def _validated_resources(self) -> Dict[str, str]:
+        """Returns the CPU, memory and hugepages reserved for the workload container.
+
+        The same integer number of cores and the same memory are used as requests and
+        limits. With the reservation of the Juju containers, the pod has Guaranteed QoS and
+        the workload container gets exclusive cores from the kubelet static CPU manager.
+
+        Returns:
+            dict: Quantities by resource name, empty if no resources are configured.
+
+        Raises:
+            ValueError: If only one of cpu-cores and memory is set, if hugepages are set
+                without them or if an option is invalid.
+        """
+        cpu_cores = self._config_cpu_cores
+        memory = self._config_memory
+        hugepages = self._config_hugepages
+        if not cpu_cores and not memory:
+            if hugepages:
+                raise ValueError("hugepages requires cpu-cores and memory to be set")
+            return {}
+        if not isinstance(cpu_cores, int) or isinstance(cpu_cores, bool) or cpu_cores < 1:
+            raise ValueError("cpu-cores must be a positive integer when memory is set")
+        if not MEMORY_QUANTITY_PATTERN.match(memory):
+            raise ValueError("memory must be a quantity such as 4Gi when cpu-cores is set")
+        resources = {"cpu": str(cpu_cores), "memory": memory}
+        if hugepages:
+            if not MEMORY_QUANTITY_PATTERN.match(hugepages):
+                raise ValueError("hugepages must be a quantity such as 1Gi")
+            if self._config_hugepages_page_size not in HUGEPAGES_PAGE_SIZES:
+                raise ValueError(
+                    f"hugepages-page-size must be one of {', '.join(HUGEPAGES_PAGE_SIZES)}"
+                )
+            resources[f"hugepages-{self._config_hugepages_page_size}"] = hugepages
+        return resources
+
+    def _validated_statefulset_config(self) -> Tuple[Dict[str, str], List[NetworkAttachment]]:
+        """Returns the resources and networks of the workload pod, checking the service config.
+
+        Returns:
+            dict: Quantities by resource name.
+            list: Secondary networks of the pod.
+
+        Raises:
+            ValueError: If the resources, networks or service config options are invalid.
+        """
+        try:
+            resources = self._validated_resources()
+        except ValueError as e:
+            raise ValueError(f"Invalid resources config: {e}")
+        try:
+            network_attachments = self._validated_network_attachments()
+        except ValueError as e:
+            raise ValueError(f"Invalid network config: {e}")
+        try:
+            self._validate_service_config()
+        except ValueError as e:
+            raise ValueError(f"Invalid service config: {e}")
+        return resources, network_attachments
+
+    def _validated_network_attachments(self) -> List[NetworkAttachment]:
+        """Returns the dedicated access (N3) and core (N6) networks of the workload pod.
+
+        Returns:
+            list: Secondary networks of the pod, empty if none is configured.
+
+        Raises:
+            ValueError: If a network is only partially configured or invalid.
+        """
+        if self._config_host_network:
+            self._validate_host_network()
+            return []
+        if self._config_network_attachment_plugin not in NETWORK_ATTACHMENT_PLUGINS:
+            raise ValueError(
+                "network-attachment-plugin must be one of "
+                f"{', '.join(NETWORK_ATTACHMENT_PLUGINS)}"
+            )
+        network_attachments = []
+        for network, interface in (
+            (ACCESS_NETWORK, ACCESS_INTERFACE),
+            (CORE_NETWORK, CORE_INTERFACE),
+        ):
+            master = str(self.model.config.get(f"{network}-interface", "")).strip()
+            ip_address = str(self.model.config.get(f"{network}-ip", "")).strip()
+            if not master and not ip_address:
+                continue
+            if not master:
+                raise ValueError(f"{network}-interface must be set when {network}-ip is set")
+            validate_ip_interface(f"{network}-ip", ip_address)
+            network_attachments.append(
+                NetworkAttachment(
+                    name=self._network_attachment_name(network),
+                    interface=interface,
+                    master=master,
+                    plugin=self._config_network_attachment_plugin,
+                    ip_address=ip_address,
+                )
+            )
+        if network_attachments and self.app.planned_units() > 1:
+            # The static addresses are set in the pod template, shared by all the pods
+            raise ValueError(
+                f"{ACCESS_NETWORK}-ip and {CORE_NETWORK}-ip are given to every pod, "
+                "they require a single unit"
+            )
+        return network_attachments
+
+    def _validate_host_network(self) -> None:
+        """Checks that the host interfaces are configured for the host network mode.
+
+        Raises:
+            ValueError: If the access interface is not set or if Multus addresses are set.
+        """
+        if not self._config_access_interface:
+            raise ValueError("access-interface must name a host interface with host-network")
+        for network in (ACCESS_NETWORK, CORE_NETWORK):
+            if self.model.config.get(f"{network}-ip"):
+                raise ValueError(f"{network}-ip cannot be set with host-network")
+
+    def _patch_statefulset(
+        self, resources: Dict[str, str], network_attachments: List[NetworkAttachment]
+    ) -> None:
+        """Applies the network attachment definitions, then patches the statefulset.
+
+        Args:
+            resources: Requests and limits of the workload container.
+            network_attachments: Secondary networks of the pod.
+
+        Returns:
+            None
+        """
+        self._apply_network_attachment_definitions(network_attachments)
+        self.kubernetes.patch_statefulset(
+            **self._statefulset_settings(resources, network_attachments)
+        )
+
+    def _apply_network_attachment_definitions(
+        self, network_attachments: List[NetworkAttachment]
+    ) -> None:
+        for network_attachment in network_attachments:
+            self.kubernetes.apply_network_attachment_definition(
+                name=network_attachment.name, cni_config=network_attachment.cni_config
+            )
+
+    def _delete_unused_network_attachment_definitions(
+        self, network_attachments: List[NetworkAttachment]
+    ) -> None:
+        used_names = {network_attachment.name for network_attachment in network_attachments}
+        for network in (ACCESS_NETWORK, CORE_NETWORK):
+            name = self._network_attachment_name(network)
+            if name not in used_names:
+                self.kubernetes.delete_network_attachment_definition(name)
+
+    def _network_attachment_name(self, network: str) -> str:
+        return f"{self.app.name}-{network}-net"
+
+    def _reconcile_kubernetes_resources(
+        self, resources: Dict[str, str], network_attachments: List[NetworkAttachment]
+    ) -> None:
+        """Brings the statefulset and the service in line with the validated config.
+
+        Args:
+            resources: Requests and limits of the workload container.
+            network_attachments: Secondary networks of the pod.
+
+        Returns:
+            None
+        """
+        self._reconcile_statefulset(resources, network_attachments)
+        if self.service_patcher:
+            self.service_patcher.patch()
+
+    def _reconcile_statefulset(
+        self, resources: Dict[str, str], network_attachments: List[NetworkAttachment]
+    ) -> None:
+        """Patches the statefulset again if its settings drifted from the expected ones.
+
+        Network attachment definitions are not read back, they are applied every time. The
+        ones of networks that are no longer configured are deleted once the pod template
+        stops referencing them.
+
+        Args:
+            resources: Requests and limits of the workload container.
+            network_attachments: Secondary networks of the pod.
+
+        Returns:
+            None
+        """
+        if not self.unit.is_leader():
+            return
+        self._apply_network_attachment_definitions(network_attachments)
+        statefulset_settings = self._statefulset_settings(resources, network_attachments)
+        if not self.kubernetes.statefulset_is_patched(**statefulset_settings):
+            self.kubernetes.patch_statefulset(**statefulset_settings)
+            self._delete_unused_network_attachment_definitions(network_attachments)
+
+    def _statefulset_settings(
+        self, resources: Dict[str, str], network_attachments: List[NetworkAttachment]
+    ) -> dict:
+        """Returns the arguments of the statefulset patch.
+
+        Args:
+            resources: Requests and limits of the workload container.
+            network_attachments: Secondary networks of the pod.
+
+        Returns:
+            dict: Keyword arguments of `Kubernetes.patch_statefulset`.
+        """
+        pod_annotations = {}
+        if network_attachments:
+            pod_annotations[NETWORKS_ANNOTATION] = networks_annotation(network_attachments)
+        return dict(
+            statefulset_name=self.app.name,
+            container_name=self._container_name,
+            resources=resources,
+            hugepages_mount_path=HUGEPAGES_MOUNT_PATH,
+            pod_annotations=pod_annotations,
+            host_ports=HOST_NETWORK_PORTS if self._config_host_network else None,
+        )
+
+    def _update_config_file(self, config_file_context: dict) -> Tuple[bool, Optional[set]]:
+        """Renders the config file and pushes it if its content changed.
+
+        Args:
+            config_file_context: Values rendered into the config file.
+
+        Returns:
+            bool: Whether the config file was pushed.
+            set: Changed config file fields, None if they are unknown.
+        """
+        content = self._render_config_file(config_file_context)
+        if self._config_file_content_matches(content):
+            return False, set()
+        changed_fields = self._changed_config_fields(config_file_context)
+        if not changed_fields:
+            # Same values rendered into a different file, such as a new template after a
+            # charm upgrade: which fields changed is unknown.
+            changed_fields = None
+        self._push_config_file(content)
+        self._stored.config_file_context = config_file_context
+        return True, changed_fields
+
+    def _validated_workload_config(
+        self,
+    ) -> Tuple[CpuLayout, Dict[str, int], NetworkTuningProfile]:
+        """Returns the scheduling parameters and pool sizes of the UPF threads, and the tuning.
+
+        Returns:
+            CpuLayout: Scheduling parameters of the UPF threads.
+            dict: Number of threads by interface thread name.
+            NetworkTuningProfile: Kernel network settings of the workload container.
+
+        Raises:
+            ValueError: If the cpu-layout, a pool size or the network-tuning-profile config
+                option is invalid.
+        """
+        tuning_profile = NETWORK_TUNING_PROFILES.get(self._config_network_tuning_profile)
+        if not tuning_profile:
+            raise ValueError(
+                "Invalid network-tuning-profile config: must be one of "
+                f"{', '.join(NETWORK_TUNING_PROFILES)}"
+            )
+        try:
+            cpu_layout = self._validated_cpu_layout()
+        except ValueError as e:
+            raise ValueError(f"Invalid cpu-layout config: {e}")
+        try:
+            pool_sizes = self._validated_pool_sizes()
+        except ValueError as e:
+            raise ValueError(f"Invalid pool size config: {e}")
+        try:
+            self._validate_mtu_config()
+        except ValueError as e:
+            raise ValueError(f"Invalid MTU config: {e}")
+        self._validate_slices_config()
+        try:
+            self._unit_ue_pool
+        except ValueError as e:
+            raise ValueError(f"Invalid UE pool config: {e}")
+        return cpu_layout, pool_sizes, tuning_profile
+
+    def _validate_slices_config(self) -> None:
+        """Checks the slices, and that the uplink fast path does not skip their enforcement.
+
+        Raises:
+            ValueError: If the slices are invalid or require uplink enforcement with the
+                uplink fast path enabled.
+        """
+        try:
+            slices = self._config_slices
+        except ValueError as e:
+            raise ValueError(f"Invalid slices config: {e}")
+        if not self._config_uplink_fast_path:
+            return
+        enforced_slices = [slice for slice in slices if slice.uplink_enforcement]
+        if enforced_slices:
+            names = ", ".join(f"{slice.sst}/{slice.sd}/{slice.dnn}" for slice in enforced_slices)
+            raise ValueError(
+                f"Invalid uplink-fast-path config: slices need uplink enforcement: {names}"
+            )
+
+    def _validate_mtu_config(self) -> None:
+        """Checks that UE packets fit in the access network MTU once encapsulated in GTP-U.
+
+        Raises:
+            ValueError: If an MTU is out of range or if UE packets would be fragmented.
+        """
+        for option, mtu in (
+            ("access-mtu", self._config_access_mtu),
+            ("core-mtu", self._config_core_mtu),
+        ):
+            if mtu and not MIN_MTU <= mtu <= MAX_MTU:
+                raise ValueError(f"{option} must be 0 or between {MIN_MTU} and {MAX_MTU}")
+        if not MIN_MTU <= self._config_ue_mtu <= MAX_MTU:
+            raise ValueError(f"ue-mtu must be between {MIN_MTU} and {MAX_MTU}")
+        access_mtu = self._config_access_mtu or DEFAULT_MTU
+        if self._config_ue_mtu + GTPU_OVERHEAD > access_mtu:
+            raise ValueError(
+                f"ue-mtu {self._config_ue_mtu} plus {GTPU_OVERHEAD} bytes of GTP-U overhead "
+                f"exceeds the access MTU {access_mtu}"
             )
+
+    def _apply_ue_routes(self) -> List[str]:
+        """Routes the UE subnet to the SGi interface when UE traffic is not NATed.
+
+        Downlink packets to UEs then come back through the UPF instead of following the
+        default route of the workload container. The route installed before is deleted when
+        the UE sub-pool or the interface change, or when SNAT is enabled again.
+
+        Returns:
+            list: Routes that are not installed.
+        """
+        route: List[str] = []
+        interface = self._config_pgw_sgi_interface
+        if not self._config_snat:
+            if interface == "default_gateway":
+                logger.info("SGi interface is the default gateway, not adding a UE route")
+            else:
+                route = [self._unit_ue_pool, "dev", interface]
+        self._delete_stale_ue_route(route)
+        if not route:
+            return []
+        self._exec_logging_errors(["ip", "route", "replace", *route])
+        self._stored.ue_route = route
+        if not (self._exec_logging_errors(["ip", "route", "show", *route]) or "").strip():
+            return [f"route to {self._unit_ue_pool} via {interface}"]
+        return []
+
+    def _delete_stale_ue_route(self, route: List[str]) -> None:
+        """Deletes the UE route installed before, if it is not the expected one.
+
+        Args:
+            route: Expected UE route, empty if there is none.
+        """
+        installed_route = list(self._stored.ue_route)
+        if not installed_route or installed_route == route:
+            return
+        self._exec_logging_errors(["ip", "route", "del", *installed_route])
+        self._stored.ue_route = []
+        logger.info("Deleted UE route %s", " ".join(installed_route))
+
+    def _publish_unit_ue_pool(self) -> None:
+        """Publishes the UE sub-pool of the unit in the peer relation."""
+        peer_relation = self.model.get_relation(PEER_RELATION_NAME)
+        if not peer_relation:
+            return
+        peer_relation.data[self.unit]["ue-ipv4-subnet"] = self._unit_ue_pool
+
+    def _apply_mtus(self) -> List[str]:
+        """Sets the MTU of the S1U and SGi interfaces and reads it back.
+
+        Returns:
+            list: Interfaces whose MTU is not the configured one.
+        """
+        mismatches = []
+        for interface, mtu in (
+            (self._config_sgw_s1u_interface, self._config_access_mtu),
+            (self._config_pgw_sgi_interface, self._config_core_mtu),
+        ):
+            if not mtu or interface == "default_gateway":
+                continue
+            self._exec_logging_errors(["ip", "link", "set", "dev", interface, "mtu", str(mtu)])
+            actual_mtu = self._exec_logging_errors(["cat", f"/sys/class/net/{interface}/mtu"])
+            if (actual_mtu or "").strip() != str(mtu):
+                mismatches.append(f"mtu {mtu} on {interface}")
+        return mismatches
+
+    def _apply_network_tuning(self, tuning_profile: NetworkTuningProfile) -> List[str]:
+        """Applies kernel network settings in the workload container and reads them back.
+
+        Settings of a previous profile that the new one does not have are reverted: sysctls
+        get back the value they had before the charm first changed them, and conntrack
+        bypass rules are deleted.
+
+        Args:
+            tuning_profile: Kernel network settings.
+
+        Returns:
+            list: Settings that do not have the expected value after being applied.
+        """
+        self._restore_sysctls(keep=set(tuning_profile.sysctls))
+        if tuning_profile.sysctls:
+            self._save_original_sysctls(list(tuning_profile.sysctls))
+            assignments = [f"{key}={value}" for key, value in tuning_profile.sysctls.items()]
+            self._exec_logging_errors(["sysctl", "-e", "-w", *assignments])
+        unused_ports = set(MANAGED_NOTRACK_UDP_PORTS) - set(tuning_profile.notrack_udp_ports)
+        for rule in notrack_rules(tuple(sorted(unused_ports))):
+            if self._exec_logging_errors(["iptables", "-t", "raw", "-C"] + rule) is not None:
+                self._exec_logging_errors(["iptables", "-t", "raw", "-D"] + rule)
+        for rule in notrack_rules(tuning_profile.notrack_udp_ports):
+            if self._exec_logging_errors(["iptables", "-t", "raw", "-C"] + rule) is None:
+                self._exec_logging_errors(["iptables", "-t", "raw", "-A"] + rule)
+        return self._network_tuning_mismatches(tuning_profile)
+
+    def _save_original_sysctls(self, keys: List[str]) -> None:
+        """Remembers the value of sysctls before the charm changes them for the first time.
+
+        Args:
+            keys: Sysctl keys about to be changed.
+        """
+        new_keys = [key for key in keys if key not in self._stored.original_sysctls]
+        if not new_keys:
+            return
+        output = self._exec_logging_errors(["sysctl", "-e", *new_keys])
+        original_sysctls = dict(self._stored.original_sysctls)
+        original_sysctls.update(parse_sysctl_output(output or ""))
+        self._stored.original_sysctls = original_sysctls
+
+    def _restore_sysctls(self, keep: Set[str]) -> None:
+        """Sets back the original value of the sysctls that are no longer tuned.
+
+        Args:
+            keep: Sysctl keys that are still tuned.
+        """
+        original_sysctls = dict(self._stored.original_sysctls)
+        restored_sysctls = {
+            key: value for key, value in original_sysctls.items() if key not in keep
+        }
+        if not restored_sysctls:
+            return
+        assignments = [f"{key}={value}" for key, value in restored_sysctls.items()]
+        self._exec_logging_errors(["sysctl", "-e", "-w", *assignments])
+        for key in restored_sysctls:
+            del original_sysctls[key]
+        self._stored.original_sysctls = original_sysctls
+        logger.info("Restored sysctls: %s", ", ".join(sorted(restored_sysctls)))
+
+    def _apply_packet_steering(self, cpu_layout: CpuLayout) -> List[str]:
+        """Steers the packet processing of the S1U and SGi interfaces to the UPF thread CPUs.
+
+        Args:
+            cpu_layout: Scheduling parameters of the UPF threads.
+
+        Returns:
+            list: Interfaces whose packet steering could not be applied.
+        """
+        if not self._config_packet_steering:
+            return []
+        failed_interfaces = []
+        for interface, cpus in self._packet_steering_cpus(cpu_layout).items():
+            mask = cpu_mask(cpus)
+            if self._exec_logging_errors(packet_steering_command(interface, mask)) is None:
+                failed_interfaces.append(f"packet steering on {interface}")
+            else:
+                logger.info("Steered packets of %s to CPU mask %s", interface, mask)
+        return failed_interfaces
+
+    def _packet_steering_cpus(self, cpu_layout: CpuLayout) -> Dict[str, Set[int]]:
+        """Returns the CPUs processing the packets of each data plane interface.
+
+        Packets of the S1U interface are processed on the CPUs of the S1U and ITTI S1U
+        threads, and those of the SGi interface on the CPU of the SGi thread. Interfaces
+        whose threads are not pinned are left alone.
+
+        Args:
+            cpu_layout: Scheduling parameters of the UPF threads.
+
+        Returns:
+            dict: CPU IDs by interface name.
+        """
+        interface_threads = (
+            (self._config_sgw_s1u_interface, (S1U, ITTI_S1U)),
+            (self._config_pgw_sgi_interface, (SGI,)),
+        )
+        steering_cpus: Dict[str, Set[int]] = {}
+        for interface, threads in interface_threads:
+            cpus: Set[int] = set()
+            for thread in threads:
+                cpu_id = cpu_layout.threads[thread].cpu_id
+                if cpu_id is not None:
+                    cpus.add(cpu_id)
+            if cpus and interface != "default_gateway":
+                steering_cpus.setdefault(interface, set()).update(cpus)
+        return steering_cpus
+
+    def _on_show_network_affinity_action(self, event: ActionEvent) -> None:
+        """Reports the packet steering masks of the S1U and SGi interfaces.
+
+        Args:
+            event: Juju event
+
+        Returns:
+            None
+        """
+        if not self._container.can_connect():
+            event.fail("Workload container is not available")
             return
+        results = {}
+        for name, interface in (
+            ("s1u", self._config_sgw_s1u_interface),
+            ("sgi", self._config_pgw_sgi_interface),
+        ):
+            results[f"{name}-interface"] = interface
+            output = self._exec_logging_errors(network_affinity_command(interface))
+            if output is None:
+                results[f"{name}-error"] = f"could not read masks of {interface}"
+                continue
+            masks = dict(line.split("=", 1) for line in output.splitlines() if "=" in line)
+            for kind, prefix in (("rps", "rx-"), ("xps", "tx-"), ("irq", "irq-")):
+                results[f"{name}-{kind}"] = " ".join(
+                    f"{key}={mask}" for key, mask in masks.items() if key.startswith(prefix)
+                )
+        event.set_results(results)
+
+    def _network_tuning_mismatches(self, tuning_profile: NetworkTuningProfile) -> List[str]:
+        """Returns the kernel network settings of the workload that differ from the profile.
+
+        Args:
+            tuning_profile: Kernel network settings.
+
+        Returns:
+            list: Sysctl keys and conntrack bypass rules that are not applied.
+        """
+        mismatches: List[str] = []
+        if tuning_profile.sysctls:
+            output = self._exec_logging_errors(["sysctl", "-e"] + list(tuning_profile.sysctls))
+            values = parse_sysctl_output(output or "")
+            mismatches.extend(
+                key for key, value in tuning_profile.sysctls.items() if values.get(key) != value
+            )
+        for port in tuning_profile.notrack_udp_ports:
+            for rule in notrack_rules((port,)):
+                if self._exec_logging_errors(["iptables", "-t", "raw", "-C"] + rule) is None:
+                    mismatches.append(f"notrack udp/{port}")
+                    break
+        return mismatches
+
+    def _exec_logging_errors(self, command: List[str]) -> Optional[str]:
+        """Runs a command in the workload container.
+
+        Args:
+            command: Command and arguments.
+
+        Returns:
+            str: Standard output of the command, or None if it failed.
+        """
+        try:
+            stdout, _ = self._container.exec(command).wait_output()
+        except (ExecError, APIError, ChangeError) as e:
+            logger.warning("Command %s failed in workload container: %s", command[0], e)
+            return None
+        return stdout
+
+    def _validated_cpu_layout(self) -> CpuLayout:
+        """Returns the CPU layout from config, checked against the workload CPUs.
+
+        Returns:
+            CpuLayout: Scheduling parameters of the UPF threads.
+
+        Raises:
+            ValueError: If the layout is invalid or pins threads to unavailable CPUs.
+        """
+        cpu_layout = parse_cpu_layout(self._config_cpu_layout)
+        if not cpu_layout.pinned_cpus:
+            return cpu_layout
+        unavailable_cpus = cpu_layout.pinned_cpus - self._workload_cpus
+        if unavailable_cpus:
+            raise ValueError(
+                "CPUs not available in workload container: "
+                f"{', '.join(str(cpu) for cpu in sorted(unavailable_cpus))}"
+            )
+        return cpu_layout
+
+    def _validated_pool_sizes(self) -> Dict[str, int]:
+        """Returns the size of the thread pool of every interface.
+
+        Pools configured as `auto` are sized from the CPUs available to the workload.
+
+        Returns:
+            dict: Number of threads by interface thread name.
+
+        Raises:
+            ValueError: If a pool size is invalid or the workload CPUs could not be read.
+        """
+        pool_sizes = {}
+        auto_size = None
+        for thread in INTERFACE_THREADS:
+            option = f"{thread}-pool-size"
+            pool_size = str(self.model.config.get(option, "1")).strip()
+            if pool_size == POOL_SIZE_AUTO and thread in AUTO_SIZED_POOL_THREADS:
+                if auto_size is None:
+                    auto_size = auto_pool_size(self._workload_cpus, self._workload_cpu_limit)
+                    logger.info("Sizing auto thread pools to %d threads", auto_size)
+                pool_sizes[thread] = auto_size
+            elif pool_size.isdigit() and int(pool_size) > 0:
+                pool_sizes[thread] = int(pool_size)
+            else:
+                raise ValueError(f"{option} must be a positive integer or {POOL_SIZE_AUTO}")
+        return pool_sizes
+
+    @property
+    def _workload_cpus(self) -> Set[int]:
+        """Returns the CPUs that processes of the workload container may run on.
+
+        Raises:
+            ValueError: If the CPUs could not be read from the workload container.
+        """
+        try:
+            process = self._container.exec(["cat", "/proc/self/status"])
+            proc_status, _ = process.wait_output()
+        except (ExecError, APIError, ChangeError) as e:
+            raise ValueError(f"could not read CPUs of workload container: {e}")
+        return cpus_allowed_from_proc_status(proc_status)
+
+    @property
+    def _workload_cpu_limit(self) -> Optional[float]:
+        """Returns the CPU limit of the workload container cgroup, if any.
+
+        Raises:
+            ValueError: If the limit could not be read from the workload container.
+        """
+        try:
+            process = self._container.exec(CGROUP_CPU_MAX_COMMAND)
+            cpu_max, _ = process.wait_output()
+            return cpu_limit_from_cpu_max(cpu_max)
+        except (ExecError, APIError, ChangeError) as e:
+            raise ValueError(f"could not read CPU limit of workload container: {e}")
 
-        self._push_config()
-        self._update_pebble_layer()
-        self.unit.status = ActiveStatus()
+    def _changed_config_fields(self, config_file_context: dict) -> Optional[set]:
+        """Returns the config file fields that differ from the last pushed config file.
 
-    def _update_pebble_layer(self) -> None:
-        """Updates pebble layer with new configuration.
+        Args:
+            config_file_context: Values about to be rendered into the config file.
+
+        Returns:
+            set: Names of the changed fields, or None if the previous values are unknown.
+        """
+        previous_context = dict(self._stored.config_file_context)
+        if not previous_context:
+            return None
+        return {
+            field
+            for field in set(previous_context) | set(config_file_context)
+            if previous_context.get(field) != config_file_context.get(field)
+        }
+
+    def _config_change_action(self, changed_fields: Optional[set]) -> ConfigChangeAction:
+        """Returns the cheapest action that applies a change to the workload.
+
+        Args:
+            changed_fields: Changed config file fields, empty if the config file did not
+                change and None if it changed but the changed fields are unknown.
+
+        Returns:
+            ConfigChangeAction: Action to take.
+        """
+        if not self._pebble_layer_matches:
+            logger.info("Pebble layer changed, replanning")
+            return ConfigChangeAction.REPLAN
+        if changed_fields is None:
+            logger.info("Config file changed in unknown fields, restarting")
+            return ConfigChangeAction.RESTART
+        if not changed_fields:
+            logger.info("Config file and pebble layer unchanged, nothing to do")
+            return ConfigChangeAction.NONE
+        # oai_spgwu only reads spgw_u.conf when it starts, NRF endpoint included, so any
+        # changed field takes effect after a restart only.
+        logger.info("Config fields changed, restarting: %s", sorted(changed_fields))
+        return ConfigChangeAction.RESTART
+
+    def _apply_config_change(self, action: ConfigChangeAction) -> None:
+        """Applies a config change action on the workload.
+
+        Args:
+            action: Action to take.
 
         Returns:
             None
         """
-        self._container.add_layer("upf", self._pebble_layer, combine=True)
-        self._container.replan()
-        self._container.restart(self._service_name)
+        if action == ConfigChangeAction.REPLAN:
+            self._container.add_layer("upf", self._pebble_layer, combine=True)
+            self._container.replan()
+        elif action == ConfigChangeAction.RESTART:
+            self._container.restart(self._service_name)
+
+    @property
+    def _pebble_layer_matches(self) -> bool:
+        """Returns whether the upf service in the current plan matches the desired layer."""
+        current_service = self._container.get_plan().services.get(self._service_name)
+        if not current_service:
+            return False
+        desired_service = Layer(self._pebble_layer).services[self._service_name]
+        return current_service.to_dict() == desired_service.to_dict()
 
     @property
     def _nrf_relation_created(self) -> bool:
@@ -152,47 +1220,88 @@ class Oai5GUPFOperatorCharm(CharmBase):
             return False
         return True
 
-    def _push_config(self) -> None:
-        jinja2_environment = Environment(loader=FileSystemLoader("src/templates/"))
-        template = jinja2_environment.get_template(f"{CONFIG_FILE_NAME}.j2")
-        content = template.render(
+    def _render_config_file(self, config_file_context: dict) -> str:
+        template = get_template(str(self.charm_dir), f"{CONFIG_FILE_NAME}.j2")
+        return template.render(**config_file_context)
+
+    def _config_file_context(
+        self, nrf_endpoint: NRFEndpoint, cpu_layout: CpuLayout, pool_sizes: Dict[str, int]
+    ) -> dict:
+        """Returns the values rendered into the config file.
+
+        Args:
+            nrf_endpoint: NRF endpoint read from relation data.
+            cpu_layout: Scheduling parameters of the UPF threads.
+            pool_sizes: Number of threads by interface thread name.
+
+        Returns:
+            dict: Config file values by template variable name.
+        """
+        return dict(
+            **self._cpu_layout_context(cpu_layout),
+            **{f"{thread}_pool_size": size for thread, size in pool_sizes.items()},
             spgw_fqdn=self._config_spgw_fqdn,
             instance=self._config_instance,
             pid_directory=self._config_pid_directory,
             sgw_s1u_interface=self._config_sgw_s1u_interface,
-            thread_s1u_priority=self._config_thread_s1u_priority,
             sgw_sx_interface=self._config_sgw_sx_interface,
-            thread_sx_priority=self._config_thread_sx_priority,
             pgw_sgi_interface=self._config_pgw_sgi_interface,
-            thread_sgi_priority=self._config_thread_sgi_priority,
-            network_ue_ip=self._config_network_ue_ip,
-            spgw_c0_ip_address=self._config_spgw_c0_ip_address,
+            network_ue_ip=self._unit_ue_pool,
+            snat="yes" if self._config_snat else "no",
+            spgw_c_ip_addresses=self.upf_provides.smf_pfcp_addresses,
             bypass_ul_pfcp_rules=self._config_bypass_ul_pfcp_rules,
             enable_5g_features=self._config_enable_5g_features,
             register_nrf=self._config_register_nrf,
             use_fqdn_nrf=self._config_use_fqdn_nrf,
             upf_fqdn_5g=self._config_upf_fqdn_5g,
-            nrf_ipv4_address=self.nrf_requires.nrf_ipv4_address,
-            nrf_port=self.nrf_requires.nrf_port,
-            nrf_api_version=self.nrf_requires.nrf_api_version,
-            nrf_fqdn=self.nrf_requires.nrf_fqdn,
-            nssai_sst_0=self._config_nssai_sst_0,
-            nssai_sd_0=self._config_nssai_sd_0,
-            dnn_0=self._config_dnn_0,
-            nssai_sst_1=self._config_nssai_sst_1,
-            nssai_sd_1=self._config_nssai_sd_1,
-            dnn_1=self._config_dnn_1,
-            nssai_sst_2=self._config_nssai_sst_2,
-            nssai_sd_2=self._config_nssai_sd_2,
-            dnn_2=self._config_dnn_2,
-            nssai_sst_3=self._config_nssai_sst_3,
-            nssai_sd_3=self._config_nssai_sd_3,
-            dnn_3=self._config_dnn_3,
+            nrf_ipv4_address=nrf_endpoint.ipv4_address,
+            nrf_port=nrf_endpoint.port,
+            nrf_api_version=nrf_endpoint.api_version,
+            nrf_fqdn=nrf_endpoint.fqdn,
+            slices=[
+                {"sst": slice.sst, "sd": slice.sd, "dnn": slice.dnn}
+                for slice in self._config_slices
+            ],
         )
 
+    @staticmethod
+    def _cpu_layout_context(cpu_layout: CpuLayout) -> dict:
+        """Returns the values rendered into the config file for the UPF threads.
+
+        Args:
+            cpu_layout: Scheduling parameters of the UPF threads.
+
+        Returns:
+            dict: Config file values by template variable name.
+        """
+        context: dict = {"itti_tasks": cpu_layout.itti_tasks_configured}
+        for thread, params in cpu_layout.threads.items():
+            prefix = thread.replace("-", "_")
+            if thread in INTERFACE_THREADS:
+                prefix = f"thread_{prefix}"
+            context[f"{prefix}_cpu_id"] = params.cpu_id
+            context[f"{prefix}_sched_policy"] = params.policy
+            context[f"{prefix}_priority"] = params.priority
+        return context
+
+    def _push_config_file(self, content: str) -> None:
         self._container.push(path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}", source=content)
         logger.info(f"Wrote file to container: {CONFIG_FILE_NAME}")
 
+    def _config_file_content_matches(self, content: str) -> bool:
+        """Returns whether the config file in the container has the given content.
+
+        Args:
+            content: Rendered config file content.
+
+        Returns:
+            True if the existing file has the same content.
+        """
+        if not self._config_file_is_pushed:
+            return False
+        existing_content = self._container.pull(path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}")
+        return existing_content.read() == content
+
     @property
     def _config_file_is_pushed(self) -> bool:
         """Check if config file is pushed to the container."""
@@ -232,120 +1341,191 @@ class Oai5GUPFOperatorCharm(CharmBase):
 
     @property
     def _config_sgw_s1u_interface(self) -> str:
+        if self._config_host_network:
+            return self._config_access_interface
+        if self._config_access_interface:
+            return ACCESS_INTERFACE
         return "eth0"
 
     @property
-    def _config_thread_s1u_priority(self) -> str:
-        return "88"
+    def _config_sgw_sx_interface(self) -> str:
+        if self._config_host_network:
+            return self._config_access_interface
+        return "eth0"
 
     @property
-    def _config_sgw_sx_interface(self) -> str:
+    def _config_pgw_sgi_interface(self) -> str:
+        if self._config_host_network:
+            return self._config_core_interface or "default_gateway"
+        if self._config_core_interface:
+            return CORE_INTERFACE
         return "eth0"
 
     @property
-    def _config_thread_sx_priority(self) -> str:
-        return "88"
+    def _config_access_interface(self) -> str:
+        return str(self.model.config.get(f"{ACCESS_NETWORK}-interface", "")).strip()
 
     @property
-    def _config_pgw_sgi_interface(self) -> str:
-        return "eth0"
+    def _config_core_interface(self) -> str:
+        return str(self.model.config.get(f"{CORE_NETWORK}-interface", "")).strip()
 
     @property
-    def _config_thread_sgi_priority(self) -> str:
-        return "98"
+    def _config_service_type(self) -> str:
+        return str(self.model.config.get("service-type", "ClusterIP"))
 
     @property
-    def _config_network_ue_ip(self) -> str:
-        return self.model.config["network-ue-ip"]
+    def _config_external_traffic_policy(self) -> str:
+        return str(self.model.config.get("external-traffic-policy", ""))
 
     @property
-    def _config_spgw_c0_ip_address(self) -> str:
-        return "127.0.0.1"
+    def _config_session_affinity(self) -> str:
+        return str(self.model.config.get("session-affinity", ""))
 
     @property
-    def _config_bypass_ul_pfcp_rules(self) -> str:
-        return "no"
+    def _config_host_network(self) -> bool:
+        return bool(self.model.config.get("host-network", False))
 
     @property
-    def _config_enable_5g_features(self) -> str:
-        return "yes"
+    def _config_network_attachment_plugin(self) -> str:
+        return str(self.model.config.get("network-attachment-plugin", "macvlan"))
 
     @property
-    def _config_register_nrf(self) -> str:
-        return "yes"
+    def _config_cpu_layout(self) -> str:
+        return str(self.model.config.get("cpu-layout", ""))
 
     @property
-    def _config_use_fqdn_nrf(self) -> str:
-        return "yes"
+    def _config_cpu_cores(self) -> int:
+        return int(self.model.config.get("cpu-cores", 0))
 
     @property
-    def _config_upf_fqdn_5g(self) -> str:
-        return f"{self.model.app.name}.{self.model.name}.svc.cluster.local"
+    def _config_memory(self) -> str:
+        return str(self.model.config.get("memory", "")).strip()
+
+    @property
+    def _config_hugepages(self) -> str:
+        return str(self.model.config.get("hugepages", "")).strip()
+
+    @property
+    def _config_hugepages_page_size(self) -> str:
+        return str(self.model.config.get("hugepages-page-size", "2Mi"))
+
+    @property
+    def _config_network_tuning_profile(self) -> str:
+        return str(self.model.config.get("network-tuning-profile", "default"))
+
+    @property
+    def _config_packet_steering(self) -> bool:
+        return bool(self.model.config.get("packet-steering", False))
 
     @property
-    def _config_nssai_sst_0(self) -> str:
-        return "1"
+    def _config_access_mtu(self) -> int:
+        return int(self.model.config.get("access-mtu", 0))
 
     @property
-    def _config_nssai_sd_0(self) -> str:
-        return "1"
+    def _config_core_mtu(self) -> int:
+        return int(self.model.config.get("core-mtu", 0))
 
     @property
-    def _config_dnn_0(self) -> str:
-        return "oai"
+    def _config_ue_mtu(self) -> int:
+        return int(self.model.config.get("ue-mtu", 1400))
 
     @property
-    def _config_nssai_sst_1(self) -> str:
-        return "1"
+    def _config_snat(self) -> bool:
+        return bool(self.model.config.get("snat", True))
 
     @property
-    def _config_nssai_sd_1(self) -> str:
-        return "1"
+    def _config_network_ue_ip(self) -> str:
+        return self.model.config["network-ue-ip"]
 
     @property
-    def _config_dnn_1(self) -> str:
-        return "oai"
+    def _unit_ue_pool(self) -> str:
+        """Returns the part of `network-ue-ip` given to this unit.
+
+        Raises:
+            ValueError: If `network-ue-ip` cannot be split between the planned units.
+        """
+        return ue_sub_pool(
+            self._config_network_ue_ip,
+            ordinal=unit_ordinal(self.unit.name),
+            unit_count=self.app.planned_units(),
+        )
 
     @property
-    def _config_nssai_sst_2(self) -> str:
-        return "1"
+    def _config_bypass_ul_pfcp_rules(self) -> str:
+        return "yes" if self._config_uplink_fast_path else "no"
 
     @property
-    def _config_nssai_sd_2(self) -> str:
-        return "1"
+    def _config_uplink_fast_path(self) -> bool:
+        return bool(self.model.config.get("uplink-fast-path", False))
 
     @property
-    def _config_dnn_2(self) -> str:
-        return "oai"
+    def _config_slices(self) -> List[Slice]:
+        return parse_slices(str(self.model.config.get("slices", "")))
 
     @property
-    def _config_nssai_sst_3(self) -> str:
-        return "1"
+    def _config_enable_5g_features(self) -> str:
+        return "yes"
 
     @property
-    def _config_nssai_sd_3(self) -> str:
-        return "1"
+    def _config_register_nrf(self) -> str:
+        return "yes"
 
     @property
-    def _config_dnn_3(self) -> str:
-        return "oai"
+    def _config_use_fqdn_nrf(self) -> str:
+        return "yes"
 
     @property
-    def _pebble_layer(self) -> dict:
+    def _config_upf_fqdn_5g(self) -> str:
+        return f"{self.model.app.name}.{self.model.name}.svc.cluster.local"
+
+    @property
+    def _pebble_layer(self) -> "LayerDict":
         """Return a dictionary representing a Pebble layer."""
+        service: "ServiceDict" = {
+            "override": "replace",
+            "summary": "upf",
+            "command": f"/openair-spgwu-tiny/bin/oai_spgwu -c {BASE_CONFIG_PATH}/{CONFIG_FILE_NAME} -o",  # noqa: E501
+            "startup": "enabled",
+        }
+        if self._config_hugepages:
+            service["environment"] = {"HUGEPAGES_DIR": HUGEPAGES_MOUNT_PATH}
         return {
             "summary": "upf layer",
             "description": "pebble config layer for upf",
-            "services": {
-                self._service_name: {
-                    "override": "replace",
-                    "summary": "upf",
-                    "command": f"/openair-spgwu-tiny/bin/oai_spgwu -c {BASE_CONFIG_PATH}/{CONFIG_FILE_NAME} -o",  # noqa: E501
-                    "startup": "enabled",
-                }
-            },
+            "services": {self._service_name: service},
         }
 
 
+@functools.lru_cache(maxsize=None)
+def get_template(charm_dir: str, template_name: str) -> "Template":
+    """Returns a compiled template, compiling it at most once per process.
+
+    Compiled templates are also kept in a bytecode cache under the charm directory so that
+    the next hook processes load them instead of parsing the template again.
+
+    Args:
+        charm_dir: Root directory of the charm.
+        template_name: Name of the template file in the templates directory.
+
+    Returns:
+        Template: Compiled Jinja2 template.
+    """
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    bytecode_cache = None
+    bytecode_cache_directory = Path(charm_dir) / TEMPLATES_BYTECODE_CACHE_DIRECTORY
+    try:
+        bytecode_cache_directory.mkdir(exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(directory=str(bytecode_cache_directory))
+    except OSError as e:
+        logger.warning("Templates bytecode cache is disabled: %s", e)
+    jinja2_environment = Environment(
+        loader=FileSystemLoader(str(Path(charm_dir) / TEMPLATES_DIRECTORY)),
+        bytecode_cache=bytecode_cache,
+        auto_reload=False,
+    )
+    return jinja2_environment.get_template(template_name)
+
+
 if __name__ == "__main__":
     main(Oai5GUPFOperatorCharm)
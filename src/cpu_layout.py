@@ -0,0 +1,250 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""CPU pinning and scheduling of the UPF threads."""
+
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import yaml
+
+ITTI_TIMER = "itti-timer"
+ITTI_S1U = "itti-s1u"
+ITTI_SX = "itti-sx"
+ITTI_ASYNC_CMD = "itti-async-cmd"
+S1U = "s1u"
+SX = "sx"
+SGI = "sgi"
+
+ITTI_THREADS = (ITTI_TIMER, ITTI_S1U, ITTI_SX, ITTI_ASYNC_CMD)
+INTERFACE_THREADS = (S1U, SX, SGI)
+AUTO_SIZED_POOL_THREADS = (S1U, SGI)
+POOL_SIZE_AUTO = "auto"
+
+REALTIME_SCHED_POLICIES = ("SCHED_FIFO", "SCHED_RR")
+SCHED_POLICIES = ("SCHED_OTHER", "SCHED_IDLE", "SCHED_BATCH") + REALTIME_SCHED_POLICIES
+DEFAULT_SCHED_POLICY = "SCHED_FIFO"
+DEFAULT_SCHED_PRIORITIES = {
+    ITTI_TIMER: 85,
+    ITTI_S1U: 84,
+    ITTI_SX: 84,
+    ITTI_ASYNC_CMD: 84,
+    S1U: 88,
+    SX: 88,
+    SGI: 98,
+}
+
+
+class ThreadSchedParams(NamedTuple):
+    """Scheduling parameters of a UPF thread."""
+
+    cpu_id: Optional[int]
+    policy: str
+    priority: int
+
+
+class CpuLayout(NamedTuple):
+    """Scheduling parameters of every ITTI and interface thread."""
+
+    threads: Dict[str, ThreadSchedParams]
+    itti_tasks_configured: bool
+
+    @property
+    def pinned_cpus(self) -> Set[int]:
+        """Returns the CPUs that threads are pinned to."""
+        return {params.cpu_id for params in self.threads.values() if params.cpu_id is not None}
+
+
+def parse_cpu_layout(cpu_layout: str) -> CpuLayout:
+    """Parses the `cpu-layout` config option.
+
+    The option is a YAML (or JSON) mapping from thread name to its scheduling parameters,
+    for example `{s1u: {cpu: 2}, sgi: {cpu: 3, policy: SCHED_RR, priority: 90}}`. Threads
+    that are not listed keep the default policy and priority and are not pinned.
+
+    Args:
+        cpu_layout: Value of the config option.
+
+    Returns:
+        CpuLayout: Scheduling parameters of every thread.
+
+    Raises:
+        ValueError: If the option is not a valid CPU layout.
+    """
+    try:
+        threads = yaml.safe_load(cpu_layout) if cpu_layout else {}
+    except yaml.YAMLError as e:
+        raise ValueError(f"cpu-layout is not valid YAML: {e}")
+    if threads is None:
+        threads = {}
+    if not isinstance(threads, dict):
+        raise ValueError("cpu-layout must be a mapping of thread names")
+    unknown_threads = set(threads) - set(ITTI_THREADS + INTERFACE_THREADS)
+    if unknown_threads:
+        raise ValueError(f"unknown threads in cpu-layout: {', '.join(sorted(unknown_threads))}")
+    return CpuLayout(
+        threads={
+            thread: _parse_thread_sched_params(thread, threads.get(thread) or {})
+            for thread in ITTI_THREADS + INTERFACE_THREADS
+        },
+        itti_tasks_configured=any(thread in threads for thread in ITTI_THREADS),
+    )
+
+
+def _parse_thread_sched_params(thread: str, params: dict) -> ThreadSchedParams:
+    if not isinstance(params, dict):
+        raise ValueError(f"{thread}: scheduling parameters must be a mapping")
+    unknown_params = set(params) - {"cpu", "policy", "priority"}
+    if unknown_params:
+        raise ValueError(f"{thread}: unknown parameters: {', '.join(sorted(unknown_params))}")
+    cpu_id = params.get("cpu")
+    if cpu_id is not None and (not _is_int(cpu_id) or cpu_id < 0):
+        raise ValueError(f"{thread}: cpu must be a non-negative integer")
+    policy = params.get("policy", DEFAULT_SCHED_POLICY)
+    if policy not in SCHED_POLICIES:
+        raise ValueError(f"{thread}: policy must be one of {', '.join(SCHED_POLICIES)}")
+    if policy in REALTIME_SCHED_POLICIES:
+        priority = params.get("priority", DEFAULT_SCHED_PRIORITIES[thread])
+        if not _is_int(priority) or not 1 <= priority <= 99:
+            raise ValueError(f"{thread}: priority must be between 1 and 99 for {policy}")
+    else:
+        priority = params.get("priority", 0)
+        if priority != 0:
+            raise ValueError(f"{thread}: priority must be 0 for {policy}")
+    return ThreadSchedParams(cpu_id=cpu_id, policy=policy, priority=priority)
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_cpu_list(cpu_list: str) -> Set[int]:
+    """Parses a Linux CPU list such as `0-3,8,10-11`.
+
+    Args:
+        cpu_list: CPU list.
+
+    Returns:
+        set: CPU IDs.
+
+    Raises:
+        ValueError: If the CPU list is malformed.
+    """
+    cpus: Set[int] = set()
+    for cpu_range in cpu_list.strip().split(","):
+        if not cpu_range:
+            continue
+        first, _, last = cpu_range.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def cpus_allowed_from_proc_status(proc_status: str) -> Set[int]:
+    """Returns the CPUs a process may run on, from the content of `/proc/<pid>/status`.
+
+    Args:
+        proc_status: Content of the status file.
+
+    Returns:
+        set: CPU IDs.
+
+    Raises:
+        ValueError: If the status file has no `Cpus_allowed_list` entry.
+    """
+    for line in proc_status.splitlines():
+        key, _, value = line.partition(":")
+        if key == "Cpus_allowed_list":
+            return parse_cpu_list(value)
+    raise ValueError("Cpus_allowed_list not found in process status")
+
+
+def cpu_limit_from_cpu_max(cpu_max: str) -> Optional[float]:
+    """Returns the CPU limit of a cgroup from its quota and period.
+
+    Args:
+        cpu_max: Quota and period in microseconds, separated by a space, as found in the
+            cgroup v2 `cpu.max` file. A quota of `max` (or `-1`, as in cgroup v1) means
+            no limit.
+
+    Returns:
+        float: Number of CPUs the cgroup may use, or None if it is not limited.
+
+    Raises:
+        ValueError: If the quota and period are malformed.
+    """
+    quota, period = cpu_max.split()
+    if quota in ("max", "-1"):
+        return None
+    return int(quota) / int(period)
+
+
+def auto_pool_size(cpus: Set[int], cpu_limit: Optional[float]) -> int:
+    """Returns the size of an automatically sized data plane thread pool.
+
+    The S1U and SGi pools each get half of the CPUs the workload may use, so that together
+    they use one thread per CPU.
+
+    Args:
+        cpus: CPUs the workload may run on.
+        cpu_limit: CPU limit of the workload cgroup, if any.
+
+    Returns:
+        int: Number of threads in the pool.
+    """
+    usable_cpus = len(cpus)
+    if cpu_limit is not None:
+        usable_cpus = min(usable_cpus, int(cpu_limit))
+    return max(1, usable_cpus // 2)
+
+
+def cpu_mask(cpus: Set[int]) -> str:
+    """Returns the hexadecimal CPU mask of a set of CPUs, as written to sysfs and procfs.
+
+    Args:
+        cpus: CPU IDs.
+
+    Returns:
+        str: Mask in 32-bit words separated by commas, such as `1,00000004`.
+    """
+    mask = sum(1 << cpu for cpu in cpus)
+    words: List[int] = []
+    while True:
+        words.insert(0, mask & 0xFFFFFFFF)
+        mask >>= 32
+        if not mask:
+            break
+    return ",".join([f"{words[0]:x}"] + [f"{word:08x}" for word in words[1:]])
+
+
+def cpu_usage_from_cpu_stat(cpu_stat: str) -> float:
+    """Returns the CPU time used by a cgroup from its cgroup v2 `cpu.stat` file.
+
+    Args:
+        cpu_stat: Content of `cpu.stat`.
+
+    Returns:
+        float: CPU time in seconds.
+
+    Raises:
+        ValueError: If `cpu.stat` has no `usage_usec` line.
+    """
+    for line in cpu_stat.splitlines():
+        key, _, value = line.partition(" ")
+        if key == "usage_usec":
+            return int(value) / 1_000_000
+    raise ValueError("no usage_usec in cpu.stat")
+
+
+def cpu_load(cpu_time: float, elapsed_time: float, cpu_capacity: float) -> int:
+    """Returns how busy the CPUs of a workload were over a period.
+
+    Args:
+        cpu_time: CPU time used during the period, in seconds.
+        elapsed_time: Duration of the period, in seconds.
+        cpu_capacity: Number of CPUs the workload may use.
+
+    Returns:
+        int: Load in percent of the CPU capacity, between 0 and 100.
+    """
+    if elapsed_time <= 0 or cpu_capacity <= 0:
+        return 0
+    return max(0, min(100, round(100 * cpu_time / (elapsed_time * cpu_capacity))))
@@ -3,59 +3,353 @@
 
 """Kubernetes specific utilities."""
 
+import functools
+import json
 import logging
+import random
+import time
+from typing import Callable, Dict, Optional
 
-from lightkube import Client
+from lightkube import ApiError, Client
+from lightkube.generic_resource import create_namespaced_resource
+from lightkube.models.core_v1 import Container
 from lightkube.resources.apps_v1 import StatefulSet
 from lightkube.types import PatchType
+from lightkube.utils.quantity import parse_quantity
+
+from multus import NETWORKS_ANNOTATION
 
 logger = logging.getLogger(__name__)
 
+FIELD_MANAGER = "oai-5g-upf-operator"
+API_RETRYABLE_STATUS_CODES = (409, 429)
+API_MAX_ATTEMPTS = 5
+API_BASE_BACKOFF = 0.5
+API_MAX_BACKOFF = 8.0
+HUGEPAGES_RESOURCE_PREFIX = "hugepages-"
+HUGEPAGES_VOLUME_NAME = "hugepages"
+MANAGED_RESOURCES = ("cpu", "memory", "hugepages-2Mi", "hugepages-1Gi")
+WORKLOAD_CAPABILITIES = ["IPC_LOCK"]
+JUJU_CONTAINER_NAME = "charm"
+JUJU_INIT_CONTAINER_NAME = "charm-init"
+# A pod has Guaranteed QoS only if all its containers do, so the Juju containers get a small
+# reservation whenever the workload container has one
+JUJU_CONTAINER_RESOURCES = {"cpu": "250m", "memory": "512Mi"}
+# Pod template annotations set by the charm, removed when no longer expected
+MANAGED_POD_ANNOTATIONS = (NETWORKS_ANNOTATION,)
+
+NetworkAttachmentDefinition = create_namespaced_resource(
+    group="k8s.cni.cncf.io",
+    version="v1",
+    kind="NetworkAttachmentDefinition",
+    plural="network-attachment-definitions",
+)
+
+
+class InstrumentedClient(Client):
+    """Lightkube client counting API requests and the time spent in them."""
+
+    def __init__(self, *args, **kwargs):
+        """Initializes the client and its counters."""
+        super().__init__(*args, **kwargs)
+        self.request_count = 0
+        self.request_seconds = 0.0
+
+    def _timed(self, method_name: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(super(), method_name)(*args, **kwargs)
+        finally:
+            self.request_count += 1
+            self.request_seconds += time.perf_counter() - start
+
+    def get(self, *args, **kwargs):
+        """Gets a resource."""
+        return self._timed("get", *args, **kwargs)
+
+    def list(self, *args, **kwargs):
+        """Lists resources."""
+        return self._timed("list", *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        """Creates a resource."""
+        return self._timed("create", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """Deletes a resource."""
+        return self._timed("delete", *args, **kwargs)
+
+    def patch(self, *args, **kwargs):
+        """Patches a resource."""
+        return self._timed("patch", *args, **kwargs)
+
+    def replace(self, *args, **kwargs):
+        """Replaces a resource."""
+        return self._timed("replace", *args, **kwargs)
+
+    def apply(self, *args, **kwargs):
+        """Applies a resource with server-side apply."""
+        return self._timed("apply", *args, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def get_client() -> InstrumentedClient:
+    """Returns the K8s client shared by everything running in this hook.
+
+    Sharing the client means that the kubeconfig is loaded once and that all requests go
+    through a single connection pool, reusing kept-alive connections to the API server.
+
+    Returns:
+        InstrumentedClient: Lightkube client.
+    """
+    return InstrumentedClient()
+
 
 class Kubernetes:
     """Kubernetes main class."""
 
     def __init__(self, namespace: str):
-        """Initializes K8s client."""
-        self.client = Client()
+        """Initializes K8s helper, the client is only created on first use."""
+        self._client: Optional[InstrumentedClient] = None
         self.namespace = namespace
 
+    @property
+    def client(self) -> InstrumentedClient:
+        """Returns the shared K8s client, creating it on first use."""
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def log_api_usage(self) -> None:
+        """Logs the number of K8s API requests made in this hook and the time spent in them."""
+        if self._client is None:
+            return
+        logger.info(
+            "Kubernetes API: %d requests in %.3fs",
+            self._client.request_count,
+            self._client.request_seconds,
+        )
+
     def patch_statefulset(
         self,
         statefulset_name: str,
+        container_name: str,
+        resources: Optional[Dict[str, str]] = None,
+        hugepages_mount_path: Optional[str] = None,
+        pod_annotations: Optional[Dict[str, str]] = None,
+        host_ports: Optional[Dict[str, int]] = None,
     ) -> None:
-        """Patches a statefulset with volumes and volume mounts.
+        """Patches a statefulset with a server-side apply of the workload settings.
+
+        Only the fields owned by the charm are sent, under the charm's field manager, so the
+        statefulset is not read first and fields written by Juju are left untouched. Applying
+        the same values again does not modify the pod template, and resources that are no
+        longer given are removed.
 
         Args:
             statefulset_name: Statefulset name.
+            container_name: Workload container name.
+            resources: Quantities by resource name (`cpu`, `memory`, `hugepages-<size>`)
+                used as both requests and limits of the workload container. When given, the
+                Juju containers are reserved `JUJU_CONTAINER_RESOURCES` too, giving the pod
+                Guaranteed QoS.
+            hugepages_mount_path: Where hugetlbfs is mounted in the workload container when
+                hugepages are requested.
+            pod_annotations: Annotations of the pod template, such as Multus networks.
+            host_ports: UDP ports by name that the workload binds on the node. When given,
+                the pod uses the host network, and the scheduler does not place two pods
+                binding the same ports on one node.
 
         Returns:
             None
         """
-        statefulset = self.client.get(
-            res=StatefulSet, name=statefulset_name, namespace=self.namespace
+        self._call_with_retries(
+            self.client.patch,
+            res=StatefulSet,
+            name=statefulset_name,
+            obj=self._statefulset_patch(
+                statefulset_name,
+                container_name,
+                resources,
+                hugepages_mount_path,
+                pod_annotations,
+                host_ports,
+            ),
+            patch_type=PatchType.APPLY,
+            namespace=self.namespace,
+            field_manager=FIELD_MANAGER,
+            force=True,
         )
-        if not hasattr(statefulset, "spec"):
-            raise RuntimeError(f"Could not find `spec` in the {statefulset_name} statefulset")
+        logger.info(f"Security context and resources applied to {statefulset_name} Statefulset")
 
-        statefulset.spec.template.spec.securityContext.runAsUser = 0
-        statefulset.spec.template.spec.securityContext.runAsGroup = 0
-        statefulset.spec.template.spec.containers[1].securityContext.privileged = True
+    def apply_network_attachment_definition(self, name: str, cni_config: dict) -> None:
+        """Creates or updates a Multus NetworkAttachmentDefinition with a server-side apply.
 
-        self.client.patch(
-            res=StatefulSet,
-            name=statefulset_name,
-            obj=statefulset,
-            patch_type=PatchType.MERGE,
+        Args:
+            name: NetworkAttachmentDefinition name.
+            cni_config: CNI plugin config.
+
+        Returns:
+            None
+        """
+        self._call_with_retries(
+            self.client.patch,
+            res=NetworkAttachmentDefinition,
+            name=name,
+            obj={
+                "apiVersion": "k8s.cni.cncf.io/v1",
+                "kind": "NetworkAttachmentDefinition",
+                "metadata": {"name": name, "namespace": self.namespace},
+                "spec": {"config": json.dumps(cni_config)},
+            },
+            patch_type=PatchType.APPLY,
             namespace=self.namespace,
+            field_manager=FIELD_MANAGER,
+            force=True,
         )
-        logger.info(f"Volumes and volume mounts added to {statefulset_name} Statefulset")
+        logger.info(f"NetworkAttachmentDefinition {name} applied")
+
+    def delete_network_attachment_definition(self, name: str) -> None:
+        """Deletes a Multus NetworkAttachmentDefinition, if it exists.
+
+        Args:
+            name: NetworkAttachmentDefinition name.
+
+        Returns:
+            None
+        """
+        try:
+            self._call_with_retries(
+                self.client.delete,
+                res=NetworkAttachmentDefinition,
+                name=name,
+                namespace=self.namespace,
+            )
+        except ApiError as e:
+            if e.status.code == 404:
+                return
+            raise
+        logger.info(f"NetworkAttachmentDefinition {name} deleted")
 
-    def statefulset_is_patched(self, statefulset_name: str) -> bool:
+    def _statefulset_patch(
+        self,
+        statefulset_name: str,
+        container_name: str,
+        resources: Optional[Dict[str, str]] = None,
+        hugepages_mount_path: Optional[str] = None,
+        pod_annotations: Optional[Dict[str, str]] = None,
+        host_ports: Optional[Dict[str, int]] = None,
+    ) -> dict:
+        """Returns the server-side apply patch declaring the fields owned by the charm.
+
+        Args:
+            statefulset_name: Statefulset name.
+            container_name: Workload container name.
+            resources: Requests and limits of the workload container.
+            hugepages_mount_path: Where hugetlbfs is mounted in the workload container.
+            pod_annotations: Annotations of the pod template.
+            host_ports: UDP ports by name bound on the node by the host network pod.
+
+        Returns:
+            dict: Partial statefulset.
+        """
+        container: dict = {
+            "name": container_name,
+            "securityContext": {
+                "privileged": True,
+                "capabilities": {"add": WORKLOAD_CAPABILITIES},
+            },
+        }
+        pod_spec: dict = {
+            "securityContext": {"runAsUser": 0, "runAsGroup": 0},
+            "containers": [container],
+        }
+        if resources:
+            container["resources"] = {"requests": resources, "limits": resources}
+            juju_resources = {
+                "requests": JUJU_CONTAINER_RESOURCES,
+                "limits": JUJU_CONTAINER_RESOURCES,
+            }
+            pod_spec["containers"].append(
+                {"name": JUJU_CONTAINER_NAME, "resources": juju_resources}
+            )
+            pod_spec["initContainers"] = [
+                {"name": JUJU_INIT_CONTAINER_NAME, "resources": juju_resources}
+            ]
+        if host_ports:
+            pod_spec["hostNetwork"] = True
+            pod_spec["dnsPolicy"] = "ClusterFirstWithHostNet"
+            container["ports"] = [
+                {"name": name, "containerPort": port, "hostPort": port, "protocol": "UDP"}
+                for name, port in host_ports.items()
+            ]
+        pod_template: dict = {"spec": pod_spec}
+        if pod_annotations:
+            pod_template["metadata"] = {"annotations": pod_annotations}
+        hugepages_page_size = _hugepages_page_size(resources or {})
+        if hugepages_page_size and hugepages_mount_path:
+            container["volumeMounts"] = [
+                {"name": HUGEPAGES_VOLUME_NAME, "mountPath": hugepages_mount_path},
+            ]
+            pod_spec["volumes"] = [
+                {
+                    "name": HUGEPAGES_VOLUME_NAME,
+                    "emptyDir": {"medium": f"HugePages-{hugepages_page_size}"},
+                },
+            ]
+        return {
+            "apiVersion": "apps/v1",
+            "kind": "StatefulSet",
+            "metadata": {"name": statefulset_name, "namespace": self.namespace},
+            "spec": {
+                "template": pod_template,
+            },
+        }
+
+    @staticmethod
+    def _call_with_retries(function: Callable, *args, **kwargs):
+        """Calls the K8s API, retrying on conflicts and throttling with exponential backoff.
+
+        Args:
+            function: Client method to call.
+            *args: Positional arguments of the call.
+            **kwargs: Keyword arguments of the call.
+
+        Returns:
+            The return value of the call.
+        """
+        for attempt in range(API_MAX_ATTEMPTS):
+            try:
+                return function(*args, **kwargs)
+            except ApiError as e:
+                if e.status.code not in API_RETRYABLE_STATUS_CODES:
+                    raise
+                if attempt == API_MAX_ATTEMPTS - 1:
+                    raise
+                delay = random.uniform(0, min(API_MAX_BACKOFF, API_BASE_BACKOFF * 2**attempt))
+                logger.warning(
+                    "Kubernetes API returned %d, retrying in %.2fs", e.status.code, delay
+                )
+                time.sleep(delay)
+
+    def statefulset_is_patched(
+        self,
+        statefulset_name: str,
+        container_name: str,
+        resources: Optional[Dict[str, str]] = None,
+        hugepages_mount_path: Optional[str] = None,
+        pod_annotations: Optional[Dict[str, str]] = None,
+        host_ports: Optional[Dict[str, int]] = None,
+    ) -> bool:
         """Returns whether the statefulset is patched or not.
 
         Args:
             statefulset_name: Statefulset name.
+            container_name: Workload container name.
+            resources: Expected requests and limits of the workload container.
+            hugepages_mount_path: Expected hugetlbfs mount path in the workload container.
+            pod_annotations: Expected annotations of the pod template.
+            host_ports: Expected UDP ports bound on the node by the host network pod.
 
         Returns:
             True if the statefulset is patched, False otherwise.
@@ -66,16 +360,118 @@ class Kubernetes:
         if not hasattr(statefulset, "spec"):
             raise RuntimeError(f"Could not find `spec` in the {statefulset_name} statefulset")
 
-        if statefulset.spec.template.spec.securityContext.runAsUser != 0:
-            logger.info("runAsUser is not set to 0")
+        security_context = statefulset.spec.template.spec.securityContext
+        if security_context.runAsUser != 0 or security_context.runAsGroup != 0:
+            logger.info("runAsUser or runAsGroup is not set to 0")
             return False
 
-        if statefulset.spec.template.spec.securityContext.runAsGroup != 0:
-            logger.info("runAsGroup is not set to 0")
+        container = _get_container(statefulset, container_name)
+        if not container or not container.securityContext:
+            logger.info("workload container is not privileged")
             return False
 
-        if not statefulset.spec.template.spec.containers[1].securityContext.privileged:
+        if not container.securityContext.privileged:
             logger.info("workload container is not privileged")
             return False
 
+        capabilities = container.securityContext.capabilities
+        if not capabilities or not set(WORKLOAD_CAPABILITIES) <= set(capabilities.add or []):
+            logger.info("workload container lacks capabilities: %s", WORKLOAD_CAPABILITIES)
+            return False
+
+        if not _pod_resources_match(statefulset, container, resources or {}):
+            logger.info("container resources differ from the expected ones")
+            return False
+
+        if _hugepages_page_size(resources or {}) and not _container_mounts(
+            container, hugepages_mount_path
+        ):
+            logger.info("hugepages are not mounted in the workload container")
+            return False
+
+        if not _pod_annotations_match(statefulset, pod_annotations or {}):
+            logger.info("pod template annotations differ from the expected ones")
+            return False
+
+        if not _host_network_matches(statefulset, container, host_ports or {}):
+            logger.info("pod host network settings differ from the expected ones")
+            return False
+
         return True
+
+
+def _get_container(statefulset: StatefulSet, container_name: str) -> Optional[Container]:
+    """Returns a container or init container of the statefulset pod template by name."""
+    pod_spec = statefulset.spec.template.spec
+    if not pod_spec:
+        return None
+    for container in pod_spec.containers + (pod_spec.initContainers or []):
+        if container.name == container_name:
+            return container
+    return None
+
+
+def _container_resources_match(container: Container, resources: Dict[str, str]) -> bool:
+    """Returns whether a container requests and is limited to the given CPU and memory."""
+    container_resources = container.resources
+    for quantities in (
+        container_resources.requests if container_resources else None,
+        container_resources.limits if container_resources else None,
+    ):
+        for name in MANAGED_RESOURCES:
+            actual = (quantities or {}).get(name)
+            expected = resources.get(name)
+            if actual is None or expected is None:
+                if actual != expected:
+                    return False
+            elif parse_quantity(actual) != parse_quantity(expected):
+                return False
+    return True
+
+
+def _pod_resources_match(
+    statefulset: StatefulSet, container: Container, resources: Dict[str, str]
+) -> bool:
+    """Returns whether the workload and Juju containers request and are limited as expected."""
+    if not _container_resources_match(container, resources):
+        return False
+    juju_resources = JUJU_CONTAINER_RESOURCES if resources else {}
+    for juju_container_name in (JUJU_CONTAINER_NAME, JUJU_INIT_CONTAINER_NAME):
+        juju_container = _get_container(statefulset, juju_container_name)
+        if juju_container and not _container_resources_match(juju_container, juju_resources):
+            return False
+    return True
+
+
+def _hugepages_page_size(resources: Dict[str, str]) -> Optional[str]:
+    """Returns the size of the hugepages in resources, such as `2Mi`, if any."""
+    for name in resources:
+        if name.startswith(HUGEPAGES_RESOURCE_PREFIX):
+            return name.replace(HUGEPAGES_RESOURCE_PREFIX, "", 1)
+    return None
+
+
+def _container_mounts(container: Container, mount_path: Optional[str]) -> bool:
+    """Returns whether a container has a volume mounted at the given path."""
+    return any(mount.mountPath == mount_path for mount in container.volumeMounts or [])
+
+
+def _pod_annotations_match(statefulset: StatefulSet, annotations: Dict[str, str]) -> bool:
+    """Returns whether the pod template has the given annotations and no stale managed one."""
+    metadata = statefulset.spec.template.metadata
+    actual_annotations = (metadata.annotations if metadata else None) or {}
+    return all(
+        actual_annotations.get(key) == annotations.get(key)
+        for key in set(annotations) | set(MANAGED_POD_ANNOTATIONS)
+    )
+
+
+def _host_network_matches(
+    statefulset: StatefulSet, container: Container, host_ports: Dict[str, int]
+) -> bool:
+    """Returns whether the pod uses the host network and the host ports as expected."""
+    pod_spec = statefulset.spec.template.spec
+    if bool(pod_spec and pod_spec.hostNetwork) != bool(host_ports):
+        return False
+    bound_ports = {(port.hostPort, port.protocol) for port in container.ports or []}
+    return all((port, "UDP") in bound_ports for port in host_ports.values())
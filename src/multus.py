@@ -0,0 +1,79 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Multus network attachments of the UPF pod."""
+
+import ipaddress
+import json
+from typing import List, NamedTuple
+
+NETWORKS_ANNOTATION = "k8s.v1.cni.cncf.io/networks"
+NETWORK_ATTACHMENT_PLUGINS = ("macvlan", "host-device")
+CNI_VERSION = "0.3.1"
+
+
+class NetworkAttachment(NamedTuple):
+    """Secondary pod interface attached to a host network through a Multus CNI plugin."""
+
+    name: str
+    interface: str
+    master: str
+    plugin: str
+    ip_address: str
+
+    @property
+    def cni_config(self) -> dict:
+        """Returns the CNI config of the NetworkAttachmentDefinition.
+
+        Addresses are static and given by the pod annotation.
+        """
+        config: dict = {
+            "cniVersion": CNI_VERSION,
+            "type": self.plugin,
+            "capabilities": {"ips": True},
+            "ipam": {"type": "static"},
+        }
+        if self.plugin == "macvlan":
+            config["master"] = self.master
+            config["mode"] = "bridge"
+        else:
+            config["device"] = self.master
+        return config
+
+    @property
+    def network_selection(self) -> dict:
+        """Returns the network selection element of the pod networks annotation."""
+        return {"name": self.name, "interface": self.interface, "ips": [self.ip_address]}
+
+
+def networks_annotation(network_attachments: List[NetworkAttachment]) -> str:
+    """Returns the value of the pod annotation attaching the pod to the given networks.
+
+    Args:
+        network_attachments: Networks to attach the pod to.
+
+    Returns:
+        str: JSON list of network selection elements.
+    """
+    return json.dumps(
+        [network_attachment.network_selection for network_attachment in network_attachments]
+    )
+
+
+def validate_ip_interface(option: str, value: str) -> None:
+    """Checks that a config option is an IPv4 address with a prefix length.
+
+    Args:
+        option: Name of the config option.
+        value: Value of the config option.
+
+    Raises:
+        ValueError: If the value is not an IPv4 address with a prefix length.
+    """
+    error = f"{option} must be an IPv4 address with a prefix length, such as 10.0.0.2/24"
+    try:
+        interface = ipaddress.ip_interface(value)
+    except ValueError:
+        raise ValueError(error)
+    if interface.version != 4 or "/" not in value:
+        raise ValueError(error)
@@ -0,0 +1,136 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Kernel network tuning profiles of the UPF workload container."""
+
+import shlex
+from typing import Dict, List, NamedTuple, Tuple
+
+GTPU_PORT = 2152
+PFCP_PORT = 8805
+
+
+class NetworkTuningProfile(NamedTuple):
+    """Kernel settings applied in the workload container before the UPF starts."""
+
+    sysctls: Dict[str, str]
+    notrack_udp_ports: Tuple[int, ...]
+
+
+NETWORK_TUNING_PROFILES = {
+    # Leaves the kernel settings untouched
+    "default": NetworkTuningProfile(sysctls={}, notrack_udp_ports=()),
+    # Large socket buffers and backlog so that bursts of GTP-U packets are not dropped
+    "high-throughput": NetworkTuningProfile(
+        sysctls={
+            "net.core.rmem_max": "67108864",
+            "net.core.wmem_max": "67108864",
+            "net.core.rmem_default": "16777216",
+            "net.core.wmem_default": "16777216",
+            "net.core.netdev_max_backlog": "250000",
+            "net.ipv4.conf.all.rp_filter": "2",
+            "net.ipv4.conf.default.rp_filter": "2",
+        },
+        notrack_udp_ports=(GTPU_PORT, PFCP_PORT),
+    ),
+    # Busy polling of the sockets instead of waiting for interrupts, with moderate buffers
+    "low-latency": NetworkTuningProfile(
+        sysctls={
+            "net.core.rmem_max": "16777216",
+            "net.core.wmem_max": "16777216",
+            "net.core.netdev_max_backlog": "5000",
+            "net.core.busy_read": "50",
+            "net.core.busy_poll": "50",
+            "net.ipv4.conf.all.rp_filter": "2",
+            "net.ipv4.conf.default.rp_filter": "2",
+        },
+        notrack_udp_ports=(GTPU_PORT, PFCP_PORT),
+    ),
+}
+
+# UDP ports whose conntrack bypass is managed by the charm, removed when a profile does
+# not ask for it
+MANAGED_NOTRACK_UDP_PORTS = (GTPU_PORT, PFCP_PORT)
+
+
+def parse_sysctl_output(output: str) -> Dict[str, str]:
+    """Parses the `key = value` lines printed by `sysctl`.
+
+    Args:
+        output: Output of `sysctl`.
+
+    Returns:
+        dict: Values by sysctl key.
+    """
+    values = {}
+    for line in output.splitlines():
+        key, separator, value = line.partition("=")
+        if separator:
+            values[key.strip()] = value.strip()
+    return values
+
+
+def notrack_rules(udp_ports: Tuple[int, ...]) -> List[List[str]]:
+    """Returns the iptables raw table rules bypassing conntrack for UDP ports.
+
+    Args:
+        udp_ports: UDP destination ports.
+
+    Returns:
+        list: Arguments of each rule, after the iptables check/append option.
+    """
+    return [
+        [chain, "-p", "udp", "--dport", str(port), "-j", "CT", "--notrack"]
+        for port in udp_ports
+        for chain in ("PREROUTING", "OUTPUT")
+    ]
+
+
+def packet_steering_command(interface: str, mask: str) -> List[str]:
+    """Returns the command steering the packet processing of an interface to CPUs.
+
+    The mask is written as the Receive Packet Steering mask of every RX queue, the Transmit
+    Packet Steering mask of every TX queue and the affinity of the interface IRQs, if it
+    has its own (physical or host-device interfaces).
+
+    Args:
+        interface: Interface name.
+        mask: CPU mask.
+
+    Returns:
+        list: Command and arguments.
+    """
+    queues = shlex.quote(f"/sys/class/net/{interface}/queues")
+    msi_irqs = shlex.quote(f"/sys/class/net/{interface}/device/msi_irqs")
+    mask = shlex.quote(mask)
+    return [
+        "sh",
+        "-ec",
+        f'for q in {queues}/rx-*; do echo {mask} > "$q/rps_cpus"; done; '
+        f'for q in {queues}/tx-*; do echo {mask} > "$q/xps_cpus"; done; '
+        f"for irq in $(ls {msi_irqs} 2>/dev/null); do "
+        f'echo {mask} > "/proc/irq/$irq/smp_affinity"; done',
+    ]
+
+
+def network_affinity_command(interface: str) -> List[str]:
+    """Returns the command printing the packet steering masks of an interface.
+
+    The command prints one `<queue or irq>=<mask>` line per RX queue, TX queue and IRQ.
+
+    Args:
+        interface: Interface name.
+
+    Returns:
+        list: Command and arguments.
+    """
+    queues = shlex.quote(f"/sys/class/net/{interface}/queues")
+    msi_irqs = shlex.quote(f"/sys/class/net/{interface}/device/msi_irqs")
+    return [
+        "sh",
+        "-ec",
+        f'cd {queues}; for q in rx-*; do echo "$q=$(cat $q/rps_cpus)"; done; '
+        f'for q in tx-*; do echo "$q=$(cat $q/xps_cpus)"; done; '
+        f"for irq in $(ls {msi_irqs} 2>/dev/null); do "
+        f'echo "irq-$irq=$(cat /proc/irq/$irq/smp_affinity)"; done',
+    ]
@@ -0,0 +1,68 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Network slices served by the UPF."""
+
+from typing import List, NamedTuple
+
+import yaml
+
+
+class Slice(NamedTuple):
+    """Network slice and data network served by the UPF."""
+
+    sst: int
+    sd: str
+    dnn: str
+    uplink_enforcement: bool = False
+
+
+DEFAULT_SLICES = [Slice(sst=1, sd="1", dnn="oai") for _ in range(4)]
+
+
+def parse_slices(slices: str) -> List[Slice]:
+    """Parses the `slices` config option.
+
+    The option is a YAML (or JSON) list of slices, for example
+    `[{sst: 1, sd: "1", dnn: internet}, {sst: 2, sd: "2", dnn: ims, uplink-enforcement: true}]`.
+    Slices with `uplink-enforcement` need every uplink packet to be matched against the PFCP
+    rules of its session, for example for uplink gating, QoS or usage reporting.
+
+    Args:
+        slices: Value of the config option.
+
+    Returns:
+        list: Slices, the default ones if the option is empty.
+
+    Raises:
+        ValueError: If the option is not a valid list of slices.
+    """
+    if not slices:
+        return list(DEFAULT_SLICES)
+    try:
+        items = yaml.safe_load(slices)
+    except yaml.YAMLError as e:
+        raise ValueError(f"slices is not valid YAML: {e}")
+    if not isinstance(items, list) or not items:
+        raise ValueError("slices must be a non-empty list")
+    return [_parse_slice(index, item) for index, item in enumerate(items)]
+
+
+def _parse_slice(index: int, item: dict) -> Slice:
+    if not isinstance(item, dict):
+        raise ValueError(f"slice {index}: must be a mapping")
+    unknown_keys = set(item) - {"sst", "sd", "dnn", "uplink-enforcement"}
+    if unknown_keys:
+        raise ValueError(f"slice {index}: unknown keys: {', '.join(sorted(unknown_keys))}")
+    sst = item.get("sst")
+    if not isinstance(sst, int) or isinstance(sst, bool) or not 0 <= sst <= 255:
+        raise ValueError(f"slice {index}: sst must be an integer between 0 and 255")
+    sd, dnn = item.get("sd"), item.get("dnn")
+    if not isinstance(sd, (str, int)) or isinstance(sd, bool) or not str(sd):
+        raise ValueError(f"slice {index}: sd must be set")
+    if not isinstance(dnn, str) or not dnn:
+        raise ValueError(f"slice {index}: dnn must be set")
+    uplink_enforcement = item.get("uplink-enforcement", False)
+    if not isinstance(uplink_enforcement, bool):
+        raise ValueError(f"slice {index}: uplink-enforcement must be a boolean")
+    return Slice(sst=sst, sd=str(sd), dnn=dnn, uplink_enforcement=uplink_enforcement)
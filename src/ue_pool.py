@@ -0,0 +1,56 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Partitioning of the UE IP pool between the units of the UPF."""
+
+import ipaddress
+
+# Smallest sub-pool handed to a unit
+MAX_SUB_POOL_PREFIX_LENGTH = 30
+
+
+def unit_ordinal(unit_name: str) -> int:
+    """Returns the ordinal of a unit, which is also the ordinal of its pod.
+
+    Args:
+        unit_name: Unit name, such as `oai-5g-upf/1`.
+
+    Returns:
+        int: Unit ordinal.
+    """
+    return int(unit_name.rsplit("/", 1)[1])
+
+
+def ue_sub_pool(network: str, ordinal: int, unit_count: int) -> str:
+    """Returns the part of the UE pool given to a unit.
+
+    The pool is split into the smallest power of two of equal subnets that gives one subnet
+    to each of the `unit_count` units and to the unit itself, and the unit gets the subnet
+    of its ordinal. Sub-pools therefore only move when the unit count crosses a power of
+    two, and a single unit keeps the whole pool.
+
+    Args:
+        network: UE pool, such as `12.1.1.0/24`.
+        ordinal: Unit ordinal.
+        unit_count: Number of units of the application.
+
+    Returns:
+        str: Sub-pool of the unit.
+
+    Raises:
+        ValueError: If the pool is not an IPv4 subnet or is too small for the units.
+    """
+    try:
+        pool = ipaddress.IPv4Network(network)
+    except ValueError:
+        raise ValueError("network-ue-ip must be an IPv4 subnet")
+    sub_pool_count = max(unit_count, ordinal + 1, 1)
+    prefix_length = pool.prefixlen + (sub_pool_count - 1).bit_length()
+    if sub_pool_count > 1 and prefix_length > MAX_SUB_POOL_PREFIX_LENGTH:
+        raise ValueError(f"network-ue-ip {network} is too small for {sub_pool_count} units")
+    if prefix_length == pool.prefixlen:
+        return str(pool)
+    sub_pool_size = 2 ** (32 - prefix_length)
+    return str(
+        ipaddress.IPv4Network((int(pool.network_address) + ordinal * sub_pool_size, prefix_length))
+    )
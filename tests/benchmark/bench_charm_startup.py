@@ -0,0 +1,101 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Benchmark of the charm start-up cost for each hook type.
+
+Each hook runs in a fresh interpreter, like a Juju dispatch. The measured time covers the
+import of the charm module, the charm `__init__` and the handling of the hook, with calls to
+the Kubernetes API stubbed out. The heavy modules loaded by the end of the hook are reported
+as well, so that a regression in lazy loading shows up.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+HOOKS = ["update-status", "config-changed", "install", "upgrade-charm"]
+HEAVY_MODULES = ["lightkube", "jinja2"]
+RUNS = 5
+
+CHILD_SCRIPT = """
+import importlib.abc
+import importlib.util
+import json
+import sys
+import time
+from unittest.mock import MagicMock, PropertyMock, patch
+
+import ops.testing
+
+
+class StubKubernetesClient(importlib.abc.MetaPathFinder):
+    # Stubs the lightkube HTTP client once lightkube is imported, without importing it early.
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != "lightkube.core.client":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        exec_module = spec.loader.exec_module
+
+        def _exec_module(module):
+            exec_module(module)
+            module.GenericSyncClient = MagicMock()
+
+        spec.loader.exec_module = _exec_module
+        return spec
+
+
+hook = sys.argv[1]
+sys.meta_path.insert(0, StubKubernetesClient())
+start = time.perf_counter()
+with patch(
+    "charms.observability_libs.v1.kubernetes_service_patch.KubernetesServicePatch._namespace",
+    new_callable=PropertyMock,
+    return_value="bench",
+):
+    import charm
+
+    harness = ops.testing.Harness(charm.Oai5GUPFOperatorCharm)
+    harness.set_model_name("bench")
+    harness.begin()
+    getattr(harness.charm.on, hook.replace("-", "_")).emit()
+    elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _run_hook(hook: str) -> dict:
+    root = Path(__file__).parents[2]
+    environment = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([str(root), str(root / "lib"), str(root / "src")]),
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, hook],
+        capture_output=True,
+        check=True,
+        cwd=root,
+        env=environment,
+        text=True,
+    )
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def main() -> None:
+    """Prints the best import-plus-init time and the heavy modules loaded for each hook."""
+    for hook in HOOKS:
+        results = [_run_hook(hook) for _ in range(RUNS)]
+        best = min(result["elapsed"] for result in results)
+        loaded = [
+            module
+            for module in HEAVY_MODULES
+            if any(name.split(".")[0] == module for name in results[0]["modules"])
+        ]
+        print(f"{hook:>15}: {best * 1e3:8.1f} ms, heavy modules loaded: {loaded or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Micro-benchmark of the spgw_u.conf template rendering.
+
+Measures:
+    cold: a new process without bytecode cache parses, compiles and renders the template.
+    bytecode: a new process loads the template from the on-disk bytecode cache and renders it.
+    memoized: a template already compiled by the current process is rendered.
+"""
+
+import shutil
+import tempfile
+import timeit
+from pathlib import Path
+
+import charm
+from cpu_layout import INTERFACE_THREADS, parse_cpu_layout
+
+ITERATIONS = 200
+TEMPLATE_NAME = f"{charm.CONFIG_FILE_NAME}.j2"
+CONTEXT = {
+    **charm.Oai5GUPFOperatorCharm._cpu_layout_context(parse_cpu_layout("")),
+    **{f"{thread}_pool_size": 1 for thread in INTERFACE_THREADS},
+    "spgw_fqdn": "gw1.spgw.node.epc.mnc99.mcc208.3gpp.org",
+    "instance": "0",
+    "pid_directory": "/var/run",
+    "sgw_s1u_interface": "eth0",
+    "sgw_sx_interface": "eth0",
+    "pgw_sgi_interface": "eth0",
+    "network_ue_ip": "12.1.1.0/24",
+    "snat": "yes",
+    "spgw_c_ip_addresses": ["10.1.2.3"],
+    "bypass_ul_pfcp_rules": "no",
+    "enable_5g_features": "yes",
+    "register_nrf": "yes",
+    "use_fqdn_nrf": "yes",
+    "upf_fqdn_5g": "oai-5g-upf.model.svc.cluster.local",
+    "nrf_ipv4_address": "1.2.3.4",
+    "nrf_port": "80",
+    "nrf_api_version": "v1",
+    "nrf_fqdn": "nrf.example.com",
+    "slices": [{"sst": 1, "sd": "1", "dnn": "oai"} for _ in range(4)],
+}
+
+
+def _render(charm_dir: str) -> None:
+    charm.get_template(charm_dir, TEMPLATE_NAME).render(**CONTEXT)
+
+
+def _new_process_render(charm_dir: str) -> None:
+    charm.get_template.cache_clear()
+    _render(charm_dir)
+
+
+def _cold_render(charm_dir: str) -> None:
+    shutil.rmtree(Path(charm_dir) / charm.TEMPLATES_BYTECODE_CACHE_DIRECTORY, ignore_errors=True)
+    _new_process_render(charm_dir)
+
+
+def main() -> None:
+    """Prints the mean render time of each scenario."""
+    with tempfile.TemporaryDirectory() as charm_dir:
+        shutil.copytree(
+            Path(__file__).parents[2] / charm.TEMPLATES_DIRECTORY,
+            Path(charm_dir) / charm.TEMPLATES_DIRECTORY,
+        )
+        scenarios = {
+            "cold": _cold_render,
+            "bytecode": _new_process_render,
+            "memoized": _render,
+        }
+        for name, function in scenarios.items():
+            seconds = timeit.timeit(lambda: function(charm_dir), number=ITERATIONS)
+            print(f"{name:>10}: {seconds / ITERATIONS * 1e6:10.1f} us/render")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Benchmark of the hook tool invocations needed to read the NRF endpoint.
+
+Compares reading the NRF endpoint through the individual `FiveGNRFRequires` properties, as
+the charm used to do in `config-changed`, with taking a single `NRFEndpoint` snapshot. Each
+scenario runs against a fresh model, like a new hook, and counts the calls made to the model
+backend, each of which is a hook tool (`relation-ids`, `relation-get`, ...) under Juju, and
+the time taken by later reads in the same hook, once ops has cached the relation data.
+"""
+
+import collections
+import functools
+import timeit
+from typing import Tuple
+
+import ops.testing
+
+import charm
+
+ITERATIONS = 1000
+HOOK_TOOLS = ("relation_ids", "relation_list", "relation_get", "relation_remote_app_name")
+NRF_RELATION_DATA = {
+    "nrf_ipv4_address": "1.2.3.4",
+    "nrf_port": "80",
+    "nrf_fqdn": "nrf.example.com",
+    "nrf_api_version": "v1",
+}
+
+
+def _read_with_properties(nrf_requires) -> None:
+    if not nrf_requires.nrf_ipv4_address_available:
+        return
+    _ = (
+        nrf_requires.nrf_ipv4_address,
+        nrf_requires.nrf_port,
+        nrf_requires.nrf_api_version,
+        nrf_requires.nrf_fqdn,
+    )
+
+
+def _read_with_snapshot(nrf_requires) -> None:
+    nrf_endpoint = nrf_requires.get_nrf_endpoint()
+    if not nrf_endpoint:
+        return
+    _ = (
+        nrf_endpoint.ipv4_address,
+        nrf_endpoint.port,
+        nrf_endpoint.api_version,
+        nrf_endpoint.fqdn,
+    )
+
+
+def _measure(read) -> Tuple[collections.Counter, float]:
+    harness = ops.testing.Harness(charm.Oai5GUPFOperatorCharm)
+    try:
+        relation_id = harness.add_relation("fiveg-nrf", "nrf")
+        harness.add_relation_unit(relation_id, "nrf/0")
+        harness.update_relation_data(relation_id, "nrf", NRF_RELATION_DATA)
+        harness.begin()
+        # Drop the cached relations, as a new hook would start without them
+        harness.model.relations._invalidate("fiveg-nrf")
+        calls: collections.Counter = collections.Counter()
+        backend = harness._backend
+        for name in HOOK_TOOLS:
+            setattr(backend, name, _counted(getattr(backend, name), name, calls))
+        read(harness.charm.nrf_requires)
+        seconds = timeit.timeit(lambda: read(harness.charm.nrf_requires), number=ITERATIONS)
+        return calls, seconds / ITERATIONS
+    finally:
+        harness.cleanup()
+
+
+def _counted(method, name: str, calls: collections.Counter):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        calls[name] += 1
+        return method(*args, **kwargs)
+
+    return wrapper
+
+
+def main() -> None:
+    """Prints the hook tool invocations and read time of each way to read the NRF endpoint."""
+    for name, read in (("properties", _read_with_properties), ("snapshot", _read_with_snapshot)):
+        calls, seconds = _measure(read)
+        details = ", ".join(f"{tool}={count}" for tool, count in sorted(calls.items()))
+        print(
+            f"{name:>10}: {sum(calls.values()):3d} hook tool calls ({details}), "
+            f"{seconds * 1e6:6.1f} us per read once cached"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,77 @@
 # Copyright 2022 Guillaume Belanger
 # See LICENSE file for licensing details.
 
+import json
+import re
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import ops.testing
-from lightkube.models.apps_v1 import StatefulSet, StatefulSetSpec
+from charms.oai_5g_upf.v0.fiveg_upf import FiveGUPFRequires
+from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
+from lightkube import ApiError
+from lightkube.models.apps_v1 import StatefulSetSpec
 from lightkube.models.core_v1 import (
+    Capabilities,
     Container,
     PodSecurityContext,
     PodSpec,
     PodTemplateSpec,
+    ResourceRequirements,
     SecurityContext,
+    ServicePort,
+    ServiceSpec,
 )
-from lightkube.models.meta_v1 import LabelSelector
+from lightkube.models.meta_v1 import LabelSelector, ObjectMeta, Status
 from lightkube.resources.apps_v1 import StatefulSet as StatefulSetResource
+from lightkube.resources.core_v1 import Service
 from lightkube.types import PatchType
-from ops.model import ActiveStatus
+from ops.charm import CharmBase
+from ops.model import ActiveStatus, BlockedStatus, RelationDataContent, WaitingStatus
 from ops.pebble import ServiceInfo, ServiceStartup, ServiceStatus
-from ops.testing import Harness
+from ops.testing import ExecArgs, ExecResult, Harness
 
 from charm import Oai5GUPFOperatorCharm
+from kubernetes import get_client
+from network_tuning import NETWORK_TUNING_PROFILES
+
+
+class DummyApiError(ApiError):
+    def __init__(self, code: int):  # noqa: D107
+        self.status = Status(code=code)
+
+
+def patched_statefulset(resources: ResourceRequirements = None) -> StatefulSetResource:
+    return StatefulSetResource(
+        spec=StatefulSetSpec(
+            selector=LabelSelector(),
+            serviceName="oai-5g-upf",
+            template=PodTemplateSpec(
+                spec=PodSpec(
+                    securityContext=PodSecurityContext(runAsUser=0, runAsGroup=0),
+                    containers=[
+                        Container(
+                            name="upf",
+                            securityContext=SecurityContext(
+                                privileged=True, capabilities=Capabilities(add=["IPC_LOCK"])
+                            ),
+                            resources=resources,
+                        )
+                    ],
+                )
+            ),
+        )
+    )
 
 
 class TestCharm(unittest.TestCase):
     @patch("lightkube.core.client.GenericSyncClient")
     @patch(
         "charm.KubernetesServicePatch",
-        lambda charm, ports: None,
+        lambda charm, ports, **kwargs: None,
     )
     def setUp(self, patch_lightkube):
+        self.addCleanup(get_client.cache_clear)
         ops.testing.SIMULATE_CAN_CONNECT = True
         self.namespace = "whatever"
         self.addCleanup(setattr, ops.testing, "SIMULATE_CAN_CONNECT", False)
@@ -57,40 +99,106 @@ class TestCharm(unittest.TestCase):
         )
         return nrf_ipv4_address, nrf_port, nrf_api_version, nrf_fqdn
 
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
     @patch("lightkube.Client.patch")
     @patch("lightkube.Client.get")
-    def test_given_statefulset_not_yet_patched_when_on_install_then_statefulset_is_patched(
+    def test_when_on_install_then_statefulset_is_patched_with_a_single_server_side_apply(
         self, patch_k8s_get, patch_k8s_patch
     ):
-        patch_k8s_get.return_value = StatefulSet(
-            spec=StatefulSetSpec(
-                template=PodTemplateSpec(
-                    spec=PodSpec(
-                        containers=[
-                            Container(
-                                name="charm",
-                            ),
-                            Container(name="workload", securityContext=SecurityContext()),
-                        ],
-                        securityContext=PodSecurityContext(),
-                    )
-                ),
-                serviceName="upf",
-                selector=LabelSelector(),
-            )
-        )
+        self.harness.set_leader(True)
         self.harness.charm.on.install.emit()
 
+        patch_k8s_get.assert_not_called()
         args, kwargs = patch_k8s_patch.call_args
-
         self.assertEqual(kwargs["name"], "oai-5g-upf")
         self.assertEqual(kwargs["namespace"], self.namespace)
         self.assertEqual(kwargs["res"], StatefulSetResource)
-        self.assertEqual(kwargs["patch_type"], PatchType.MERGE)
-        self.assertEqual(kwargs["obj"].spec.template.spec.securityContext.runAsUser, 0)
-        self.assertEqual(kwargs["obj"].spec.template.spec.securityContext.runAsGroup, 0)
+        self.assertEqual(kwargs["patch_type"], PatchType.APPLY)
+        self.assertEqual(kwargs["field_manager"], "oai-5g-upf-operator")
+        self.assertTrue(kwargs["force"])
+        self.assertEqual(
+            kwargs["obj"]["spec"],
+            {
+                "template": {
+                    "spec": {
+                        "securityContext": {"runAsUser": 0, "runAsGroup": 0},
+                        "containers": [
+                            {
+                                "name": "upf",
+                                "securityContext": {
+                                    "privileged": True,
+                                    "capabilities": {"add": ["IPC_LOCK"]},
+                                },
+                            },
+                        ],
+                    },
+                },
+            },
+        )
+
+    @patch("time.sleep")
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_api_server_throttles_when_on_install_then_statefulset_patch_is_retried(
+        self, patch_k8s_patch, patch_sleep
+    ):
+        patch_k8s_patch.side_effect = [DummyApiError(429), DummyApiError(409), None]
+
+        self.harness.set_leader(True)
+        self.harness.charm.on.install.emit()
+
+        self.assertEqual(patch_k8s_patch.call_count, 3)
+        self.assertEqual(patch_sleep.call_count, 2)
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_api_server_forbids_patch_when_on_install_then_statefulset_patch_is_not_retried(  # noqa: E501
+        self, patch_k8s_patch
+    ):
+        patch_k8s_patch.side_effect = DummyApiError(403)
+
+        self.harness.set_leader(True)
+        with self.assertRaises(ApiError):
+            self.harness.charm.on.install.emit()
+
+        self.assertEqual(patch_k8s_patch.call_count, 1)
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_unit_is_not_leader_when_on_install_then_statefulset_is_not_patched(
+        self, patch_k8s_patch
+    ):
+        self.harness.set_leader(False)
+
+        self.harness.charm.on.install.emit()
+
+        patch_k8s_patch.assert_not_called()
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_invalid_statefulset_config_when_on_install_then_status_is_blocked_and_statefulset_is_not_patched(  # noqa: E501
+        self, patch_k8s_patch
+    ):
+        self.harness.update_config(
+            {
+                "cpu-cores": 2,
+                "memory": "4Gi",
+                "access-interface": "enp1s0",
+                "access-ip": "192.168.252.3/24",
+            }
+        )
+        self.harness.set_planned_units(2)
+        self.harness.set_leader(True)
+
+        self.harness.charm.on.install.emit()
+
+        patch_k8s_patch.assert_not_called()
         self.assertEqual(
-            kwargs["obj"].spec.template.spec.containers[1].securityContext.privileged, True
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid network config: access-ip and core-ip are given to every pod, "
+                "they require a single unit"
+            ),
         )
 
     @patch("ops.model.Container.push")
@@ -205,7 +313,6 @@ class TestCharm(unittest.TestCase):
             '                      {NETWORK_IPV4 = "12.1.1.0/24";} # 1 ITEM SUPPORTED ONLY\n'  # noqa: E501, W505
             "                    );\n\n"
             "    SPGW-C_LIST = (\n"
-            '         {IPV4_ADDRESS="127.0.0.1" ;}\n'
             "    );\n\n"
             "    NON_STANDART_FEATURES :\n"
             "    {\n"
@@ -259,7 +366,9 @@ class TestCharm(unittest.TestCase):
         self.assertEqual(expected_plan, updated_plan)
         service = self.harness.model.unit.get_container("upf").get_service("upf")
         self.assertTrue(service.is_running())
-        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+        self.assertEqual(
+            self.harness.model.unit.status, ActiveStatus("Config updated, service replanned")
+        )
 
     @patch("ops.model.Container.get_service")
     def test_given_unit_is_leader_when_upf_relation_joined_then_upf_relation_data_is_set(
@@ -282,3 +391,1313 @@ class TestCharm(unittest.TestCase):
 
         assert relation_data["upf_ipv4_address"] == "127.0.0.1"
         assert relation_data["upf_fqdn"] == f"oai-5g-upf.{self.namespace}.svc.cluster.local"
+
+    @patch("ops.model.Container.restart")
+    def test_given_config_file_and_pebble_layer_unchanged_when_config_changed_then_config_file_is_not_pushed_and_service_is_not_restarted(  # noqa: E501
+        self, patch_restart
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.model.unit.get_container("upf").make_dir(
+            "/openair-spgwu-tiny/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        with patch("ops.model.Container.push") as patch_push, patch(
+            "ops.model.Container.replan"
+        ) as patch_replan:
+            self.harness.update_config({"gw-id": "1"})
+
+            patch_push.assert_not_called()
+            patch_replan.assert_not_called()
+        patch_restart.assert_not_called()
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    @patch("ops.model.Container.restart")
+    def test_given_restart_required_field_changed_when_config_changed_then_config_file_is_pushed_and_service_is_restarted(  # noqa: E501
+        self, patch_restart
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.model.unit.get_container("upf").make_dir(
+            "/openair-spgwu-tiny/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"network-ue-ip": "12.1.2.0/24"})
+
+        config_file = (
+            self.harness.model.unit.get_container("upf")
+            .pull("/openair-spgwu-tiny/etc/spgw_u.conf")
+            .read()
+        )
+        self.assertIn('{NETWORK_IPV4 = "12.1.2.0/24";}', config_file)
+        patch_restart.assert_called_once_with("upf")
+        self.assertEqual(
+            self.harness.model.unit.status, ActiveStatus("Config updated, service restarted")
+        )
+
+    @patch("ops.model.Container.restart")
+    def test_given_config_file_content_changed_without_field_change_when_config_changed_then_service_is_restarted(  # noqa: E501
+        self, patch_restart
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        container = self.harness.model.unit.get_container("upf")
+        container.make_dir("/openair-spgwu-tiny/etc", make_parents=True)
+        self._create_nrf_relation_with_valid_data()
+        patch_restart.reset_mock()
+        container.push("/openair-spgwu-tiny/etc/spgw_u.conf", source="rendered by an old template")
+
+        self.harness.update_config({"gw-id": "1"})
+
+        patch_restart.assert_called_once_with("upf")
+        self.assertEqual(
+            self.harness.model.unit.status, ActiveStatus("Config updated, service restarted")
+        )
+
+    @patch("ops.model.Container.restart")
+    def test_given_spgw_fqdn_changed_when_config_changed_then_config_file_is_pushed_and_service_is_restarted(  # noqa: E501
+        self, patch_restart
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.model.unit.get_container("upf").make_dir(
+            "/openair-spgwu-tiny/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"mcc": "001"})
+
+        config_file = (
+            self.harness.model.unit.get_container("upf")
+            .pull("/openair-spgwu-tiny/etc/spgw_u.conf")
+            .read()
+        )
+        self.assertIn('FQDN = "gw1.spgw.node.epc.mnc99.mcc001.3gpp.org"', config_file)
+        patch_restart.assert_called_once_with("upf")
+        self.assertEqual(
+            self.harness.model.unit.status, ActiveStatus("Config updated, service restarted")
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_kubernetes_requests_made_when_on_install_then_requests_share_one_client_and_are_counted(  # noqa: E501
+        self, _
+    ):
+        self.harness.set_leader(True)
+        self.harness.charm.on.install.emit()
+
+        client = self.harness.charm.kubernetes.client
+        self.assertIs(client, get_client())
+        self.assertIs(self.harness.charm._kubernetes_client(), client)
+        self.assertEqual(client.request_count, 1)
+
+    @patch("ops.model.Container.push")
+    def test_given_nrf_relation_data_incomplete_when_config_changed_then_status_is_waiting(
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        relation_id = self.harness.add_relation("fiveg-nrf", "nrf")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="nrf/0")
+        self.harness.update_relation_data(
+            relation_id=relation_id,
+            app_or_unit="nrf",
+            key_values={"nrf_ipv4_address": "1.2.3.4", "nrf_port": "81"},
+        )
+
+        self.harness.update_config({"gw-id": "1"})
+
+        patch_push.assert_not_called()
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for NRF information to be available in relation data"),
+        )
+
+    def test_given_nrf_endpoint_unchanged_when_nrf_relation_changed_then_config_file_is_not_rendered(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.model.unit.get_container("upf").make_dir(
+            "/openair-spgwu-tiny/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+        relation_id = self.harness.model.get_relation("fiveg-nrf").id
+
+        with patch("charm.Oai5GUPFOperatorCharm._render_config_file") as patch_render:
+            self.harness.update_relation_data(
+                relation_id=relation_id, app_or_unit="nrf", key_values={"unrelated": "value"}
+            )
+
+            patch_render.assert_not_called()
+
+    @patch("ops.model.Container.restart")
+    def test_given_nrf_port_changed_when_nrf_relation_changed_then_config_file_is_updated_and_service_is_restarted(  # noqa: E501
+        self, patch_restart
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.model.unit.get_container("upf").make_dir(
+            "/openair-spgwu-tiny/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+        relation_id = self.harness.model.get_relation("fiveg-nrf").id
+
+        self.harness.update_relation_data(
+            relation_id=relation_id, app_or_unit="nrf", key_values={"nrf_port": "8080"}
+        )
+
+        config_file = (
+            self.harness.model.unit.get_container("upf")
+            .pull("/openair-spgwu-tiny/etc/spgw_u.conf")
+            .read()
+        )
+        self.assertIn("PORT         = 8080;", config_file)
+        patch_restart.assert_called_once_with("upf")
+
+    def test_given_cpu_layout_pins_threads_to_available_cpus_when_config_changed_then_threads_are_pinned_in_config_file(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.model.unit.get_container("upf").make_dir(
+            "/openair-spgwu-tiny/etc", make_parents=True
+        )
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Name:\tcat\nCpus_allowed_list:\t0-3\n"
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config(
+            {"cpu-layout": "{itti-timer: {cpu: 1}, s1u: {cpu: 2, policy: SCHED_RR, priority: 90}}"}
+        )
+
+        config_file = (
+            self.harness.model.unit.get_container("upf")
+            .pull("/openair-spgwu-tiny/etc/spgw_u.conf")
+            .read()
+        )
+        self.assertIn(
+            "    ITTI_TASKS :\n"
+            "    {\n"
+            "        ITTI_TIMER_SCHED_PARAMS :\n"
+            "        {\n"
+            "            CPU_ID       = 1;\n",
+            config_file,
+        )
+        self.assertIn(
+            "                CPU_ID       = 2;\n"
+            '                SCHED_POLICY = "SCHED_RR"; # Values in { SCHED_OTHER, SCHED_IDLE, SCHED_BATCH, SCHED_FIFO, SCHED_RR }\n'  # noqa: E501, W505
+            "                SCHED_PRIORITY = 90;\n",
+            config_file,
+        )
+        self.assertEqual(
+            self.harness.model.unit.status, ActiveStatus("Config updated, service restarted")
+        )
+
+    @patch("ops.model.Container.push")
+    def test_given_cpu_layout_pins_threads_to_unavailable_cpus_when_config_changed_then_status_is_blocked(  # noqa: E501
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Cpus_allowed_list:\t0-1\n"
+        )
+        self._create_nrf_relation_with_valid_data()
+        patch_push.reset_mock()
+
+        self.harness.update_config({"cpu-layout": "{s1u: {cpu: 2}, sgi: {cpu: 3}}"})
+
+        patch_push.assert_not_called()
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid cpu-layout config: CPUs not available in workload container: 2, 3"
+            ),
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_cpu_layout_has_unknown_thread_when_config_changed_then_status_is_blocked(
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"cpu-layout": "{n3: {cpu: 2}}"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("Invalid cpu-layout config: unknown threads in cpu-layout: n3"),
+        )
+
+    def test_given_auto_pool_sizes_when_config_changed_then_pools_are_sized_from_workload_cpus(
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.model.unit.get_container("upf").make_dir(
+            "/openair-spgwu-tiny/etc", make_parents=True
+        )
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Cpus_allowed_list:\t0-7\n"
+        )
+        self.harness.handle_exec("upf", ["sh"], result="600000 100000\n")
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config(
+            {"s1u-pool-size": "auto", "sx-pool-size": "2", "sgi-pool-size": "auto"}
+        )
+
+        config_file = (
+            self.harness.model.unit.get_container("upf")
+            .pull("/openair-spgwu-tiny/etc/spgw_u.conf")
+            .read()
+        )
+        self.assertEqual(
+            re.findall(r"POOL_SIZE = (\d+);", config_file),
+            ["3", "2", "3"],
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_auto_sx_pool_size_when_config_changed_then_status_is_blocked(self):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"sx-pool-size": "auto"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid pool size config: sx-pool-size must be a positive integer or auto"
+            ),
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_resources_configured_when_on_install_then_guaranteed_resources_are_applied(
+        self, patch_k8s_patch
+    ):
+        self.harness.update_config({"cpu-cores": 4, "memory": "8Gi"})
+
+        self.harness.set_leader(True)
+        self.harness.charm.on.install.emit()
+
+        args, kwargs = patch_k8s_patch.call_args
+        container = kwargs["obj"]["spec"]["template"]["spec"]["containers"][0]
+        self.assertEqual(
+            container["resources"],
+            {
+                "requests": {"cpu": "4", "memory": "8Gi"},
+                "limits": {"cpu": "4", "memory": "8Gi"},
+            },
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_resources_configured_when_on_install_then_every_container_has_equal_requests_and_limits(  # noqa: E501
+        self, patch_k8s_patch
+    ):
+        self.harness.update_config({"cpu-cores": 4, "memory": "8Gi"})
+
+        self.harness.set_leader(True)
+        self.harness.charm.on.install.emit()
+
+        args, kwargs = patch_k8s_patch.call_args
+        pod_spec = kwargs["obj"]["spec"]["template"]["spec"]
+        containers = pod_spec["containers"] + pod_spec["initContainers"]
+        self.assertEqual(
+            {container["name"] for container in containers}, {"upf", "charm", "charm-init"}
+        )
+        for container in containers:
+            resources = container["resources"]
+            self.assertEqual(resources["requests"], resources["limits"])
+            self.assertEqual(set(resources["requests"]), {"cpu", "memory"})
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.delete", new=Mock)
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_charm_container_without_resources_when_config_changed_then_statefulset_is_patched(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        self.harness.set_leader(True)
+        statefulset = patched_statefulset(
+            ResourceRequirements(
+                requests={"cpu": "4", "memory": "8Gi"}, limits={"cpu": "4", "memory": "8Gi"}
+            )
+        )
+        statefulset.spec.template.spec.containers.append(Container(name="charm"))
+        patch_k8s_get.return_value = statefulset
+
+        self.harness.update_config({"cpu-cores": 4, "memory": "8Gi"})
+
+        patch_k8s_patch.assert_called_once()
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.delete", new=Mock)
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_statefulset_resources_drifted_when_config_changed_then_statefulset_is_patched(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        self.harness.set_leader(True)
+        patch_k8s_get.return_value = patched_statefulset(
+            ResourceRequirements(requests={"cpu": "2", "memory": "8Gi"})
+        )
+
+        self.harness.update_config({"cpu-cores": 4, "memory": "8Gi"})
+
+        patch_k8s_patch.assert_called_once()
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_statefulset_resources_match_when_config_changed_then_statefulset_is_not_patched(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        self.harness.set_leader(True)
+        patch_k8s_get.return_value = patched_statefulset(
+            ResourceRequirements(
+                requests={"cpu": "4000m", "memory": "8192Mi"},
+                limits={"cpu": "4", "memory": "8Gi"},
+            )
+        )
+
+        self.harness.update_config({"cpu-cores": 4, "memory": "8Gi"})
+
+        patch_k8s_patch.assert_not_called()
+
+    def test_given_cpu_cores_without_memory_when_config_changed_then_status_is_blocked(self):
+        self.harness.update_config({"cpu-cores": 4})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid resources config: memory must be a quantity such as 4Gi when cpu-cores is set"  # noqa: E501, W505
+            ),
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_hugepages_configured_when_on_install_then_hugepages_are_requested_and_mounted(  # noqa: E501
+        self, patch_k8s_patch
+    ):
+        self.harness.update_config(
+            {"cpu-cores": 2, "memory": "4Gi", "hugepages": "1Gi", "hugepages-page-size": "1Gi"}
+        )
+
+        self.harness.set_leader(True)
+        self.harness.charm.on.install.emit()
+
+        args, kwargs = patch_k8s_patch.call_args
+        pod_spec = kwargs["obj"]["spec"]["template"]["spec"]
+        self.assertEqual(
+            pod_spec["containers"][0]["resources"]["limits"],
+            {"cpu": "2", "memory": "4Gi", "hugepages-1Gi": "1Gi"},
+        )
+        self.assertEqual(
+            pod_spec["containers"][0]["volumeMounts"],
+            [{"name": "hugepages", "mountPath": "/dev/hugepages"}],
+        )
+        self.assertEqual(
+            pod_spec["volumes"],
+            [{"name": "hugepages", "emptyDir": {"medium": "HugePages-1Gi"}}],
+        )
+
+    def test_given_hugepages_configured_when_pebble_layer_is_built_then_hugepages_dir_is_exposed(  # noqa: E501
+        self,
+    ):
+        self.harness.update_config({"cpu-cores": 2, "memory": "4Gi", "hugepages": "1Gi"})
+
+        self.assertEqual(
+            self.harness.charm._pebble_layer["services"]["upf"]["environment"],
+            {"HUGEPAGES_DIR": "/dev/hugepages"},
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_access_and_core_networks_configured_when_config_changed_then_network_attachment_definitions_are_applied_and_pod_is_annotated(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        self.harness.set_leader(True)
+        patch_k8s_get.return_value = patched_statefulset()
+
+        self.harness.update_config(
+            {
+                "access-interface": "eth1",
+                "access-ip": "192.168.252.3/24",
+                "core-interface": "eth2",
+                "core-ip": "192.168.250.3/24",
+            }
+        )
+
+        nad_calls = [
+            call.kwargs
+            for call in patch_k8s_patch.call_args_list
+            if call.kwargs["res"] != StatefulSetResource
+        ]
+        self.assertEqual(
+            [call["name"] for call in nad_calls], ["oai-5g-upf-access-net", "oai-5g-upf-core-net"]
+        )
+        self.assertEqual(
+            json.loads(nad_calls[0]["obj"]["spec"]["config"]),
+            {
+                "cniVersion": "0.3.1",
+                "type": "macvlan",
+                "capabilities": {"ips": True},
+                "ipam": {"type": "static"},
+                "master": "eth1",
+                "mode": "bridge",
+            },
+        )
+        statefulset_patch = patch_k8s_patch.call_args_list[-1].kwargs["obj"]
+        self.assertEqual(
+            json.loads(
+                statefulset_patch["spec"]["template"]["metadata"]["annotations"][
+                    "k8s.v1.cni.cncf.io/networks"
+                ]
+            ),
+            [
+                {"name": "oai-5g-upf-access-net", "interface": "n3", "ips": ["192.168.252.3/24"]},
+                {"name": "oai-5g-upf-core-net", "interface": "n6", "ips": ["192.168.250.3/24"]},
+            ],
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_access_network_configured_when_config_changed_then_n3_interface_is_rendered(
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self.harness.update_config({"access-interface": "eth1", "access-ip": "192.168.252.3/24"})
+
+        content = self.harness.charm._render_config_file(
+            self.harness.charm._stored.config_file_context
+        )
+
+        self.assertIn('INTERFACE_NAME         = "n3";  # STRING, interface name', content)
+        self.assertIn('INTERFACE_NAME         = "eth0"; # STRING, interface name or', content)
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    def test_given_host_network_configured_when_on_install_then_pod_uses_host_network_and_host_ports(  # noqa: E501
+        self, patch_k8s_patch
+    ):
+        self.harness.update_config({"host-network": True, "access-interface": "enp1s0"})
+
+        self.harness.set_leader(True)
+        self.harness.charm.on.install.emit()
+
+        pod_spec = patch_k8s_patch.call_args.kwargs["obj"]["spec"]["template"]["spec"]
+        self.assertTrue(pod_spec["hostNetwork"])
+        self.assertEqual(pod_spec["dnsPolicy"], "ClusterFirstWithHostNet")
+        self.assertEqual(
+            pod_spec["containers"][0]["ports"],
+            [
+                {"name": "pfcp", "containerPort": 8805, "hostPort": 8805, "protocol": "UDP"},
+                {"name": "gtpu", "containerPort": 2152, "hostPort": 2152, "protocol": "UDP"},
+            ],
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_host_network_configured_when_config_changed_then_host_interfaces_are_rendered(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self.harness.update_config({"host-network": True, "access-interface": "enp1s0"})
+
+        context = self.harness.charm._stored.config_file_context
+
+        self.assertEqual(context["sgw_s1u_interface"], "enp1s0")
+        self.assertEqual(context["sgw_sx_interface"], "enp1s0")
+        self.assertEqual(context["pgw_sgi_interface"], "default_gateway")
+
+    def test_given_host_network_without_access_interface_when_config_changed_then_status_is_blocked(  # noqa: E501
+        self,
+    ):
+        self.harness.update_config({"host-network": True})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid network config: access-interface must name a host interface with host-network"  # noqa: E501, W505
+            ),
+        )
+
+    @patch("charm.KubernetesServicePatch")
+    def test_given_service_config_when_charm_starts_then_service_patch_uses_it(
+        self, patch_service_patch
+    ):
+        harness = Harness(Oai5GUPFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.update_config(
+            {
+                "service-type": "LoadBalancer",
+                "external-traffic-policy": "Local",
+                "session-affinity": "ClientIP",
+            }
+        )
+
+        harness.begin()
+
+        kwargs = patch_service_patch.call_args.kwargs
+        self.assertEqual(kwargs["service_type"], "LoadBalancer")
+        self.assertEqual(kwargs["external_traffic_policy"], "Local")
+        self.assertEqual(kwargs["session_affinity"], "ClientIP")
+        self.assertNotIn("refresh_event", kwargs)
+
+    @patch("charm.KubernetesServicePatch")
+    def test_given_valid_service_config_when_config_changed_then_service_is_patched(
+        self, patch_service_patch
+    ):
+        harness = Harness(Oai5GUPFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+
+        harness.update_config({"service-type": "NodePort"})
+
+        patch_service_patch.return_value.patch.assert_called_once()
+
+    @patch("charm.KubernetesServicePatch")
+    def test_given_invalid_service_config_when_charm_starts_then_service_is_not_patched(
+        self, patch_service_patch
+    ):
+        harness = Harness(Oai5GUPFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.update_config({"service-type": "LoadBalancer", "external-traffic-policy": "local"})
+
+        harness.begin()
+        harness.charm.on.config_changed.emit()
+
+        patch_service_patch.assert_not_called()
+        self.assertIsNone(harness.charm.service_patcher)
+
+    def test_given_external_traffic_policy_with_cluster_ip_service_when_config_changed_then_status_is_blocked(  # noqa: E501
+        self,
+    ):
+        self.harness.update_config({"external-traffic-policy": "Local"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid service config: external-traffic-policy requires a NodePort or LoadBalancer service-type"  # noqa: E501, W505
+            ),
+        )
+
+    @patch(
+        "charms.observability_libs.v1.kubernetes_service_patch.KubernetesServicePatch._namespace",
+        "whatever",
+    )
+    def test_given_service_external_traffic_policy_drifted_when_is_patched_then_returns_false(
+        self,
+    ):
+        client = Mock()
+        client.get.return_value = Service(
+            spec=ServiceSpec(
+                type="LoadBalancer",
+                externalTrafficPolicy="Cluster",
+                ports=[ServicePort(port=2152, targetPort=2152, protocol="UDP")],
+            )
+        )
+        service_patch = KubernetesServicePatch(
+            self.harness.charm,
+            [ServicePort(port=2152, targetPort=2152, protocol="UDP")],
+            service_type="LoadBalancer",
+            external_traffic_policy="Local",
+            client_factory=lambda: client,
+        )
+
+        self.assertFalse(service_patch.is_patched())
+
+        client.get.return_value.spec.externalTrafficPolicy = "Local"
+        self.assertTrue(service_patch.is_patched())
+
+    def _handle_kernel_exec(self, namespaced_sysctls: set):
+        """Simulates sysctl and iptables in the workload container."""
+        sysctls: dict = {}
+        rules: list = []
+
+        def sysctl(args: ExecArgs) -> ExecResult:
+            assignments = [arg for arg in args.command[1:] if not arg.startswith("-")]
+            if "-w" in args.command:
+                for assignment in assignments:
+                    key, _, value = assignment.partition("=")
+                    if key in namespaced_sysctls:
+                        sysctls[key] = value
+                return ExecResult()
+            return ExecResult(
+                stdout="".join(
+                    f"{key} = {sysctls[key]}\n" for key in assignments if key in sysctls
+                )
+            )
+
+        def iptables(args: ExecArgs) -> ExecResult:
+            option, rule = args.command[3], args.command[4:]
+            if option == "-A":
+                rules.append(rule)
+            elif rule not in rules:
+                return ExecResult(exit_code=1)
+            elif option == "-D":
+                rules.remove(rule)
+            return ExecResult()
+
+        self.harness.handle_exec("upf", ["sysctl"], handler=sysctl)
+        self.harness.handle_exec("upf", ["iptables"], handler=iptables)
+        return sysctls, rules
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_high_throughput_tuning_profile_when_config_changed_then_sysctls_and_conntrack_bypass_are_applied(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        sysctls, rules = self._handle_kernel_exec(
+            namespaced_sysctls=set(NETWORK_TUNING_PROFILES["high-throughput"].sysctls)
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"network-tuning-profile": "high-throughput"})
+
+        self.assertEqual(sysctls["net.core.rmem_max"], "67108864")
+        self.assertEqual(sysctls["net.core.netdev_max_backlog"], "250000")
+        self.assertIn(
+            ["PREROUTING", "-p", "udp", "--dport", "2152", "-j", "CT", "--notrack"], rules
+        )
+        self.assertEqual(len(rules), 4)
+        self.assertIsInstance(self.harness.model.unit.status, ActiveStatus)
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_sysctls_not_applied_in_container_when_config_changed_then_status_reports_mismatch(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._handle_kernel_exec(
+            namespaced_sysctls={
+                "net.core.netdev_max_backlog",
+                "net.core.busy_read",
+                "net.core.busy_poll",
+                "net.ipv4.conf.all.rp_filter",
+                "net.ipv4.conf.default.rp_filter",
+            }
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"network-tuning-profile": "low-latency"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("Network tuning not applied: net.core.rmem_max, net.core.wmem_max"),
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_packet_steering_and_pinned_threads_when_config_changed_then_interface_masks_follow_thread_cpus(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Cpus_allowed_list:\t0-35\n"
+        )
+        steering_commands = []
+        self.harness.handle_exec(
+            "upf",
+            ["sh", "-ec"],
+            handler=lambda args: steering_commands.append(args.command[2]) or ExecResult(),
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config(
+            {
+                "access-interface": "eth1",
+                "access-ip": "192.168.252.3/24",
+                "cpu-layout": "{s1u: {cpu: 2}, itti-s1u: {cpu: 3}, sgi: {cpu: 33}}",
+                "packet-steering": True,
+            }
+        )
+
+        self.assertEqual(len(steering_commands), 2)
+        self.assertIn('echo c > "$q/rps_cpus"', steering_commands[0])
+        self.assertIn("/sys/class/net/n3/queues/rx-*", steering_commands[0])
+        self.assertIn('echo 2,00000000 > "$q/xps_cpus"', steering_commands[1])
+        self.assertIn("/sys/class/net/eth0/queues/tx-*", steering_commands[1])
+
+    def test_given_interface_masks_when_show_network_affinity_action_then_masks_are_reported(
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.handle_exec(
+            "upf",
+            ["sh", "-ec"],
+            result="rx-0=4\nrx-1=4\ntx-0=0\nirq-45=4\n",
+        )
+
+        output = self.harness.run_action("show-network-affinity")
+
+        self.assertEqual(output.results["s1u-interface"], "eth0")
+        self.assertEqual(output.results["s1u-rps"], "rx-0=4 rx-1=4")
+        self.assertEqual(output.results["s1u-xps"], "tx-0=0")
+        self.assertEqual(output.results["sgi-irq"], "irq-45=4")
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_access_and_core_mtu_when_config_changed_then_mtu_is_set_on_interfaces(self):
+        self.harness.set_can_connect(container="upf", val=True)
+        mtus = {}
+
+        def ip_link(args: ExecArgs) -> ExecResult:
+            mtus[args.command[4]] = args.command[6]
+            return ExecResult()
+
+        self.harness.handle_exec("upf", ["ip", "link", "set"], handler=ip_link)
+        self.harness.handle_exec(
+            "upf",
+            ["cat"],
+            handler=lambda args: ExecResult(stdout=f"{mtus.get(args.command[1].split('/')[4])}\n"),
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config(
+            {
+                "access-interface": "eth1",
+                "access-ip": "192.168.252.3/24",
+                "access-mtu": 9000,
+                "core-mtu": 1500,
+            }
+        )
+
+        self.assertEqual(mtus, {"n3": "9000", "eth0": "1500"})
+        self.assertIsInstance(self.harness.model.unit.status, ActiveStatus)
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_ue_mtu_too_large_for_access_mtu_when_config_changed_then_status_is_blocked(
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"ue-mtu": 1500})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid MTU config: ue-mtu 1500 plus 44 bytes of GTP-U overhead exceeds the access MTU 1500"  # noqa: E501, W505
+            ),
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch", new=Mock)
+    @patch("lightkube.Client.get", new=Mock(return_value=patched_statefulset()))
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_snat_disabled_when_config_changed_then_ue_subnet_is_routed_and_published(
+        self,
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="upf", val=True)
+        routes = set()
+
+        def ip_route(args: ExecArgs) -> ExecResult:
+            route = " ".join(args.command[3:])
+            if args.command[2] == "replace":
+                routes.add(route)
+                return ExecResult()
+            return ExecResult(stdout=f"{route}\n" if route in routes else "")
+
+        self.harness.handle_exec("upf", ["ip", "route"], handler=ip_route)
+        upf_relation_id = self.harness.add_relation(relation_name="fiveg-upf", remote_app="smf")
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"snat": False})
+
+        self.assertEqual(self.harness.charm._stored.config_file_context["snat"], "no")
+        self.assertEqual(routes, {"12.1.1.0/24 dev eth0"})
+        self.assertEqual(
+            self.harness.get_relation_data(upf_relation_id, self.harness.model.app.name)[
+                "ue_ipv4_subnet"
+            ],
+            "12.1.1.0/24",
+        )
+        self.assertIsInstance(self.harness.model.unit.status, ActiveStatus)
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch", new=Mock)
+    @patch("lightkube.Client.get", new=Mock(return_value=patched_statefulset()))
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_ue_route_installed_when_ue_pool_changes_and_snat_enabled_then_previous_routes_are_deleted(  # noqa: E501
+        self,
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="upf", val=True)
+        routes = set()
+
+        def ip_route(args: ExecArgs) -> ExecResult:
+            route = " ".join(args.command[3:])
+            if args.command[2] == "replace":
+                routes.add(route)
+                return ExecResult()
+            if args.command[2] == "del":
+                routes.remove(route)
+                return ExecResult()
+            return ExecResult(stdout=f"{route}\n" if route in routes else "")
+
+        self.harness.handle_exec("upf", ["ip", "route"], handler=ip_route)
+        self._create_nrf_relation_with_valid_data()
+        self.harness.update_config({"snat": False})
+
+        self.harness.update_config({"network-ue-ip": "12.1.2.0/24"})
+
+        self.assertEqual(routes, {"12.1.2.0/24 dev eth0"})
+
+        self.harness.update_config({"snat": True})
+
+        self.assertEqual(routes, set())
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_uplink_fast_path_when_config_changed_then_uplink_pfcp_rules_are_bypassed_and_status_reports_trade_off(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"uplink-fast-path": True})
+
+        self.assertEqual(
+            self.harness.charm._stored.config_file_context["bypass_ul_pfcp_rules"], "yes"
+        )
+        self.assertIn(
+            "UL PFCP rules (QoS, gating) not enforced",
+            self.harness.model.unit.status.message,
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_uplink_fast_path_with_enforced_slice_when_config_changed_then_status_is_blocked(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config(
+            {
+                "uplink-fast-path": True,
+                "slices": '[{sst: 1, sd: "1", dnn: internet}, '
+                '{sst: 2, sd: "2", dnn: ims, uplink-enforcement: true}]',
+            }
+        )
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid uplink-fast-path config: slices need uplink enforcement: 2/2/ims"
+            ),
+        )
+
+    @patch("ops.model.Container.push")
+    def test_given_slices_configured_when_config_changed_then_upf_info_lists_slices(
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"slices": '[{sst: 1, sd: "010203", dnn: internet}]'})
+
+        pushed_config = patch_push.call_args.kwargs["source"]
+        self.assertIn(
+            '       UPF_INFO = (\n          { NSSAI_SST = 1; NSSAI_SD = "010203";  DNN_LIST = ({DNN = "internet";}); }\n       );',  # noqa: E501, W505
+            pushed_config,
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_several_planned_units_when_config_changed_then_unit_gets_its_ue_sub_pool(
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.set_planned_units(3)
+        peer_relation_id = self.harness.add_relation(
+            relation_name="upf-peers", remote_app=self.harness.model.app.name
+        )
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"network-ue-ip": "12.1.1.0/24"})
+
+        self.assertEqual(
+            self.harness.charm._stored.config_file_context["network_ue_ip"], "12.1.1.0/26"
+        )
+        self.assertEqual(
+            self.harness.get_relation_data(peer_relation_id, self.harness.model.unit.name),
+            {"ue-ipv4-subnet": "12.1.1.0/26"},
+        )
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_ue_pool_too_small_for_planned_units_when_config_changed_then_status_is_blocked(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.set_planned_units(5)
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.update_config({"network-ue-ip": "12.1.1.0/29"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid UE pool config: network-ue-ip 12.1.1.0/29 is too small for 5 units"
+            ),
+        )
+
+    @patch("charm.time")
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch", new=Mock)
+    @patch("lightkube.Client.get", new=Mock(return_value=patched_statefulset()))
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_fiveg_upf_relation_when_update_status_then_unit_endpoint_and_load_are_published(  # noqa: E501
+        self, patch_time
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.add_network("10.1.2.3")
+        cpu_usage_usec = iter(["1000000", "2000000"])
+        patch_time.time.side_effect = [1000.0, 1002.0]
+
+        def cgroup(args: ExecArgs) -> ExecResult:
+            if "cpu.stat" in args.command[2]:
+                return ExecResult(stdout=f"usage_usec {next(cpu_usage_usec)}\n")
+            return ExecResult(stdout="100000 100000\n")
+
+        self.harness.handle_exec("upf", ["sh"], handler=cgroup)
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Cpus_allowed_list:\t0-3\n"
+        )
+        upf_relation_id = self.harness.add_relation(relation_name="fiveg-upf", remote_app="smf")
+        self._create_nrf_relation_with_valid_data()
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            self.harness.get_relation_data(upf_relation_id, self.harness.model.unit.name),
+            {
+                "upf_ipv4_address": "10.1.2.3",
+                "n3_ipv4_address": "10.1.2.3",
+                "upf_fqdn": "oai-5g-upf-0.oai-5g-upf-endpoints.whatever.svc.cluster.local",
+                "cpu_cores": "1.0",
+                "pool_sizes": '{"s1u": 1, "sgi": 1, "sx": 1}',
+                "load": "50",
+            },
+        )
+
+    def test_given_upf_units_published_endpoints_when_least_loaded_upf_then_unit_with_lowest_load_is_returned(  # noqa: E501
+        self,
+    ):
+        class SMFCharm(CharmBase):
+            def __init__(self, *args):
+                super().__init__(*args)
+                self.upf_requires = FiveGUPFRequires(self, "fiveg-upf")
+
+        harness = Harness(
+            SMFCharm, meta="name: smf\nrequires:\n  fiveg-upf:\n    interface: fiveg-upf\n"
+        )
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        relation_id = harness.add_relation("fiveg-upf", "upf")
+        harness.update_relation_data(
+            relation_id,
+            "upf",
+            {"upf_ipv4_address": "127.0.0.1", "upf_fqdn": "upf.smf.svc.cluster.local"},
+        )
+        for unit_number, load in ((0, "70"), (1, "20"), (2, "")):
+            harness.add_relation_unit(relation_id, f"upf/{unit_number}")
+            harness.update_relation_data(
+                relation_id,
+                f"upf/{unit_number}",
+                {
+                    "upf_ipv4_address": f"10.1.2.{unit_number}",
+                    "n3_ipv4_address": f"192.168.250.{unit_number}",
+                    "upf_fqdn": f"upf-{unit_number}.upf-endpoints.smf.svc.cluster.local",
+                    "cpu_cores": "4.0",
+                    "pool_sizes": '{"s1u": 2, "sgi": 2, "sx": 1}',
+                    "load": load,
+                },
+            )
+
+        least_loaded_upf = harness.charm.upf_requires.least_loaded_upf()
+
+        self.assertEqual(len(harness.charm.upf_requires.upf_units), 2)
+        self.assertEqual(least_loaded_upf.unit_name, "upf/1")
+        self.assertEqual(least_loaded_upf.n3_ipv4_address, "192.168.250.1")
+        self.assertEqual(least_loaded_upf.pool_sizes, {"s1u": 2, "sgi": 2, "sx": 1})
+
+    def test_given_smf_related_to_several_upfs_when_related_upfs_then_upfs_are_indexed_by_relation_and_dnn(  # noqa: E501
+        self,
+    ):
+        class SMFCharm(CharmBase):
+            def __init__(self, *args):
+                super().__init__(*args)
+                self.upf_requires = FiveGUPFRequires(self, "fiveg-upf")
+
+        harness = Harness(
+            SMFCharm, meta="name: smf\nrequires:\n  fiveg-upf:\n    interface: fiveg-upf\n"
+        )
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        relation_ids = {}
+        for upf_name, dnns in (("upf-edge", ["internet", "ims"]), ("upf-core", ["internet"])):
+            relation_ids[upf_name] = harness.add_relation("fiveg-upf", upf_name)
+            harness.update_relation_data(
+                relation_ids[upf_name],
+                upf_name,
+                {
+                    "upf_ipv4_address": "127.0.0.1",
+                    "upf_fqdn": f"{upf_name}.smf.svc.cluster.local",
+                    "slices": json.dumps([{"sst": 1, "sd": "1", "dnn": dnn} for dnn in dnns]),
+                },
+            )
+
+        related_upfs = harness.charm.upf_requires.related_upfs
+
+        self.assertEqual(
+            related_upfs.by_relation_id[relation_ids["upf-core"]].upf_fqdn,
+            "upf-core.smf.svc.cluster.local",
+        )
+        self.assertEqual(
+            [upf.app_name for upf in related_upfs.by_dnn["internet"]], ["upf-edge", "upf-core"]
+        )
+        self.assertEqual([upf.app_name for upf in related_upfs.by_dnn["ims"]], ["upf-edge"])
+        self.assertEqual(len(related_upfs.by_slice[(1, "1")]), 2)
+        self.assertIsNone(harness.charm.upf_requires.upf_fqdn)
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch", new=Mock)
+    @patch("lightkube.Client.get", new=Mock(return_value=patched_statefulset()))
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_upf_relation_joined_before_service_runs_when_config_changed_then_upf_relation_data_is_set(  # noqa: E501
+        self,
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="upf", val=True)
+        relation_id = self.harness.add_relation(relation_name="fiveg-upf", remote_app="smf")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="smf/0")
+        self.assertEqual(
+            self.harness.get_relation_data(relation_id, self.harness.model.app.name), {}
+        )
+
+        self._create_nrf_relation_with_valid_data()
+
+        relation_data = self.harness.get_relation_data(relation_id, self.harness.model.app.name)
+        self.assertEqual(relation_data["upf_ipv4_address"], "127.0.0.1")
+        self.assertEqual(
+            json.loads(relation_data["slices"]), [{"sst": 1, "sd": "1", "dnn": "oai"}] * 4
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch", new=Mock)
+    @patch("lightkube.Client.get", new=Mock(return_value=patched_statefulset()))
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_upf_relation_data_up_to_date_when_update_status_then_relation_data_is_not_rewritten(  # noqa: E501
+        self,
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.add_relation(relation_name="fiveg-upf", remote_app="smf")
+        self._create_nrf_relation_with_valid_data()
+
+        with patch.object(RelationDataContent, "__setitem__") as patch_setitem:
+            self.harness.charm.on.update_status.emit()
+
+        patch_setitem.assert_not_called()
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch", new=Mock)
+    @patch("lightkube.Client.get", new=Mock(return_value=patched_statefulset()))
+    @patch("ops.model.Container.push")
+    def test_given_smf_units_publish_pfcp_addresses_when_relation_changed_then_spgw_c_list_is_rendered(  # noqa: E501
+        self, patch_push
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="upf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        for smf_name, address in (("smf-a", "10.0.0.2"), ("smf-b", "10.0.0.1")):
+            relation_id = self.harness.add_relation(relation_name="fiveg-upf", remote_app=smf_name)
+            self.harness.add_relation_unit(relation_id, f"{smf_name}/0")
+            self.harness.update_relation_data(
+                relation_id, f"{smf_name}/0", {"smf_pfcp_ipv4_address": address}
+            )
+
+        self.assertIn(
+            "    SPGW-C_LIST = (\n"
+            '         {IPV4_ADDRESS="10.0.0.1" ;},\n'
+            '         {IPV4_ADDRESS="10.0.0.2" ;}\n'
+            "    );\n",
+            patch_push.call_args.kwargs["source"],
+        )
+        self.assertEqual(
+            self.harness.model.unit.status, ActiveStatus("Config updated, service restarted")
+        )
+
+    def test_given_service_running_and_no_stored_config_when_update_status_then_unit_endpoint_is_published(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.add_network("10.1.2.3")
+        self.harness.handle_exec(
+            "upf",
+            ["sh"],
+            handler=lambda args: ExecResult(
+                stdout="usage_usec 1000000\n" if "cpu.stat" in args.command[2] else "max 100000\n"
+            ),
+        )
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Cpus_allowed_list:\t0-3\n"
+        )
+        container = self.harness.model.unit.get_container("upf")
+        container.add_layer("upf", self.harness.charm._pebble_layer, combine=True)
+        container.replan()
+        relation_id = self.harness.add_relation(relation_name="fiveg-upf", remote_app="smf")
+        self.assertEqual(dict(self.harness.charm._stored.config_file_context), {})
+
+        self.harness.charm.on.update_status.emit()
+
+        relation_data = self.harness.get_relation_data(relation_id, self.harness.model.unit.name)
+        self.assertEqual(relation_data["pool_sizes"], '{"s1u": 1, "sgi": 1, "sx": 1}')
+
+    def test_given_snat_disabled_and_two_planned_units_when_update_status_then_unit_ue_sub_pool_is_published(  # noqa: E501
+        self,
+    ):
+        self.harness.set_planned_units(2)
+        self.harness.update_config({"snat": False})
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.add_network("10.1.2.3")
+        self.harness.handle_exec(
+            "upf",
+            ["sh"],
+            handler=lambda args: ExecResult(
+                stdout="usage_usec 1000000\n" if "cpu.stat" in args.command[2] else "max 100000\n"
+            ),
+        )
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Cpus_allowed_list:\t0-3\n"
+        )
+        container = self.harness.model.unit.get_container("upf")
+        container.add_layer("upf", self.harness.charm._pebble_layer, combine=True)
+        container.replan()
+        relation_id = self.harness.add_relation(relation_name="fiveg-upf", remote_app="smf")
+
+        self.harness.charm.on.update_status.emit()
+
+        relation_data = self.harness.get_relation_data(relation_id, self.harness.model.unit.name)
+        self.assertEqual(relation_data["ue_ipv4_subnet"], "12.1.1.0/25")
+
+    def test_given_static_access_ip_and_several_planned_units_when_config_changed_then_status_is_blocked(  # noqa: E501
+        self,
+    ):
+        self.harness.set_planned_units(2)
+
+        self.harness.update_config({"access-interface": "enp1s0", "access-ip": "192.168.252.3/24"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid network config: access-ip and core-ip are given to every pod, "
+                "they require a single unit"
+            ),
+        )
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.delete")
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_networks_annotation_left_from_removed_networks_when_config_changed_then_annotation_and_network_attachment_definitions_are_removed(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch, patch_k8s_delete
+    ):
+        self.harness.set_leader(True)
+        statefulset = patched_statefulset()
+        statefulset.spec.template.metadata = ObjectMeta(
+            annotations={"k8s.v1.cni.cncf.io/networks": '[{"name": "oai-5g-upf-access-net"}]'}
+        )
+        patch_k8s_get.return_value = statefulset
+
+        self.harness.update_config({"gw-id": "1"})
+
+        statefulset_patch = patch_k8s_patch.call_args.kwargs["obj"]
+        self.assertNotIn("metadata", statefulset_patch["spec"]["template"])
+        self.assertEqual(
+            [call.kwargs["name"] for call in patch_k8s_delete.call_args_list],
+            ["oai-5g-upf-access-net", "oai-5g-upf-core-net"],
+        )
+
+    @patch("charm.time")
+    @patch("ops.model.Container.get_service")
+    def test_given_load_varies_within_a_step_when_update_status_then_unit_relation_data_is_not_rewritten(  # noqa: E501
+        self, patch_get_service, patch_time
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        self.harness.add_network("10.1.2.3")
+        patch_get_service.return_value = ServiceInfo(
+            name="upf", current=ServiceStatus.ACTIVE, startup=ServiceStartup.ENABLED
+        )
+        cpu_usage_usec = iter(["0", "530000", "1100000"])
+        patch_time.time.side_effect = [0.0, 1.0, 2.0]
+        self.harness.handle_exec(
+            "upf",
+            ["sh"],
+            handler=lambda args: ExecResult(
+                stdout=(
+                    f"usage_usec {next(cpu_usage_usec)}\n"
+                    if "cpu.stat" in args.command[2]
+                    else "100000 100000\n"
+                )
+            ),
+        )
+        self.harness.handle_exec(
+            "upf", ["cat", "/proc/self/status"], result="Cpus_allowed_list:\t0-3\n"
+        )
+        relation_id = self.harness.add_relation(relation_name="fiveg-upf", remote_app="smf")
+        self.harness.charm.on.update_status.emit()
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.get_relation_data(relation_id, self.harness.model.unit.name)["load"],
+            "50",
+        )
+
+        with patch.object(RelationDataContent, "__setitem__") as patch_setitem:
+            self.harness.charm.on.update_status.emit()
+
+        patch_setitem.assert_not_called()
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_leader_when_nrf_relation_changed_then_statefulset_is_not_checked(
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="upf", val=True)
+
+        self._create_nrf_relation_with_valid_data()
+
+        patch_k8s_get.assert_not_called()
+        patch_k8s_patch.assert_not_called()
+
+    @patch("lightkube.core.client.GenericSyncClient", new=Mock)
+    @patch("lightkube.Client.delete", new=Mock)
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_statefulset_drifted_when_upgrade_charm_then_statefulset_is_patched(
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        self.harness.set_leader(True)
+        patch_k8s_get.return_value = patched_statefulset(
+            ResourceRequirements(requests={"cpu": "2", "memory": "8Gi"})
+        )
+
+        self.harness.charm.on.upgrade_charm.emit()
+
+        patch_k8s_patch.assert_called_once()
+
+    @patch("ops.model.Container.push", new=Mock)
+    def test_given_tuned_profile_when_default_profile_configured_then_sysctls_are_restored_and_conntrack_bypass_is_removed(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="upf", val=True)
+        sysctls, rules = self._handle_kernel_exec(
+            namespaced_sysctls=set(NETWORK_TUNING_PROFILES["high-throughput"].sysctls)
+        )
+        sysctls["net.core.rmem_max"] = "212992"
+        self._create_nrf_relation_with_valid_data()
+        self.harness.update_config({"network-tuning-profile": "high-throughput"})
+
+        self.harness.update_config({"network-tuning-profile": "default"})
+
+        self.assertEqual(sysctls["net.core.rmem_max"], "212992")
+        self.assertEqual(rules, [])
+        self.assertIsInstance(self.harness.model.unit.status, ActiveStatus)